@@ -1,9 +1,18 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from fastapi import HTTPException, Depends
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
-from typing import Dict, Optional
+from typing import Dict, Optional, Tuple
 from fastapi.security import OAuth2PasswordBearer
+from app.config import AUTH_TOKEN_CACHE_SIZE, AUTH_TOKEN_CACHE_TTL, AUTH_HASH_WORKERS, AUTH_HASH_MAX_PENDING
+
+logger = logging.getLogger(__name__)
 
 # Initialize password hashing context
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -32,6 +41,89 @@ def hash_password(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+
+class PasswordHasher:
+    """Runs bcrypt in a small dedicated process pool.
+
+    bcrypt is deliberately slow, so a burst of logins would otherwise tie up
+    the threads the server needs for everything else. Requests beyond
+    ``max_pending`` are turned away with a 503 instead of queueing without
+    bound.
+    """
+
+    def __init__(self, workers: int = AUTH_HASH_WORKERS, max_pending: int = AUTH_HASH_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    async def run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            raise HTTPException(status_code=503, detail="Too many authentication requests, try again shortly", headers={"Retry-After": "1"})
+        if self._executor is None:
+            # spawn: forking a process that is already running threads is unsafe
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher()
+
+# Hash a password without blocking the server
+async def hash_password_async(password: str) -> str:
+    return await password_hasher.run(hash_password, password)
+
+# Verify a password without blocking the server
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await password_hasher.run(verify_password, plain_password, hashed_password)
+
+
+class TokenCache:
+    """Bounded LRU cache of verified tokens.
+
+    An entry lives until the token's own ``exp`` or ``ttl`` seconds, whichever
+    comes first, so a cached token is never accepted after it expires.
+    """
+
+    def __init__(self, max_size: int = AUTH_TOKEN_CACHE_SIZE, ttl: float = AUTH_TOKEN_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()  # token -> (valid until, username)
+
+    def get(self, token: str) -> Optional[str]:
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        valid_until, username = entry
+        if time.time() >= valid_until:
+            del self._entries[token]
+            return None
+        self._entries.move_to_end(token)
+        return username
+
+    def put(self, token: str, username: str, expires_at: Optional[float]):
+        valid_until = time.time() + self.ttl
+        if expires_at is not None:
+            valid_until = min(valid_until, expires_at)
+        self._entries[token] = (valid_until, username)
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+token_cache = TokenCache()
+
 # Create a JWT access token
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -40,20 +132,22 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 # Extract user from token
-def get_current_user(token: str = Depends(oauth2_scheme)):
-    print(f"DEBUG: Received token -> {token}")  # Debugging
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    username = token_cache.get(token)
+    if username is not None and username in fake_users_db:
+        return {"username": username}
 
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
-        print(f"DEBUG: Decoded username -> {username}")  # Debugging
 
         if username is None or username not in fake_users_db:
-            print("DEBUG: Invalid token detected!")  # Debugging
+            logger.info("Rejected token for unknown user %r", username)
             raise HTTPException(status_code=401, detail="Invalid token")
 
+        token_cache.put(token, username, payload.get("exp"))
         return {"username": username}
 
     except JWTError as e:
-        print(f"DEBUG: JWTError occurred -> {str(e)}")  # Debugging
+        logger.info("Rejected token: %s", e)
         raise HTTPException(status_code=401, detail="Invalid authentication")
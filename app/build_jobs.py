@@ -0,0 +1,498 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import queue
+import stat
+import tarfile
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Set, Tuple
+
+from docker.types.daemon import CancellableStream
+from docker.utils.build import exclude_paths
+
+from app.config import (
+    BUILD_CONCURRENCY,
+    BUILD_HASH_CONCURRENCY,
+    BUILD_JOB_HISTORY,
+    BUILD_LOG_LINES,
+    BUILD_CONTEXT_CHUNK_SIZE,
+    DOCKER_BUILD_TIMEOUT,
+)
+from app.docker_client import AsyncDocker, get_docker
+from app.metrics import observe_docker_call
+
+logger = logging.getLogger(__name__)
+
+HASHING, QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "hashing", "queued", "running", "succeeded", "failed", "cancelled"
+FINAL_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class BuildCancelled(Exception):
+    """Raised inside a build thread once its job has been cancelled."""
+
+
+class ContextChanged(Exception):
+    """Raised when a build context file differs from the snapshot the job was hashed from."""
+
+
+def _read_dockerignore(context_path: str) -> List[str]:
+    """Reads .dockerignore the same way the docker SDK does."""
+    dockerignore = os.path.join(context_path, ".dockerignore")
+    if not os.path.exists(dockerignore):
+        return []
+    with open(dockerignore) as f:
+        return [line.strip() for line in f.read().splitlines() if line.strip() and not line.strip().startswith("#")]
+
+
+def context_files(context_path: str, dockerfile: str) -> List[str]:
+    """Returns the sorted relative paths that make up a build context."""
+    return sorted(exclude_paths(context_path, _read_dockerignore(context_path), dockerfile=dockerfile))
+
+
+def context_hash(context_path: str, dockerfile: str, paths: List[str]) -> str:
+    """Hashes a build context's names, file types and contents without loading any file whole."""
+    digest = hashlib.sha256(dockerfile.encode() + b"\0")
+    for path in paths:
+        full_path = os.path.join(context_path, path)
+        st = os.lstat(full_path)
+        digest.update(path.encode() + b"\0" + oct(st.st_mode).encode() + b"\0")
+        if stat.S_ISLNK(st.st_mode):
+            digest.update(os.readlink(full_path).encode())
+        elif stat.S_ISREG(st.st_mode):
+            with open(full_path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _stat_key(st: os.stat_result) -> Tuple[int, int, int, int]:
+    return st.st_mode, st.st_size, st.st_mtime_ns, st.st_ino
+
+
+class ContextSnapshot:
+    """The files of a build context as they were when it was hashed.
+
+    The build sends exactly these paths and fails with ContextChanged if any
+    of them changed since, so an image always matches the ``context_hash``
+    that identical submissions were coalesced on.
+    """
+
+    def __init__(self, context_path: str, dockerfile: str):
+        self.context_path = context_path
+        self.paths = context_files(context_path, dockerfile)
+        self._stats = {path: _stat_key(os.lstat(os.path.join(context_path, path))) for path in self.paths}
+        self.hash = context_hash(context_path, dockerfile, self.paths)
+
+    def check(self, path: str, full_path: str):
+        try:
+            unchanged = _stat_key(os.lstat(full_path)) == self._stats[path]
+        except FileNotFoundError:
+            unchanged = False
+        if not unchanged:
+            raise ContextChanged(f"Build context changed since the build was submitted: {path}")
+
+
+class _QueueWriter:
+    """File-like sink that hands fixed-size chunks to a bounded queue, blocking when it is full."""
+
+    def __init__(self, chunks: queue.Queue, chunk_size: int, *stop_events: threading.Event):
+        self._chunks = chunks
+        self._chunk_size = chunk_size
+        self._stop_events = stop_events
+        self._buffer = bytearray()
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        while len(self._buffer) >= self._chunk_size:
+            self._put(bytes(self._buffer[:self._chunk_size]))
+            del self._buffer[:self._chunk_size]
+        return len(data)
+
+    def flush_rest(self):
+        if self._buffer:
+            self._put(bytes(self._buffer))
+            self._buffer.clear()
+
+    def _put(self, item):
+        while True:
+            if any(event.is_set() for event in self._stop_events):
+                raise BuildCancelled()
+            try:
+                self._chunks.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+
+_DONE = object()
+
+
+def stream_context(snapshot: ContextSnapshot, chunk_size: int, cancelled: threading.Event) -> Iterator[bytes]:
+    """Yields a build context snapshot as an uncompressed tar stream.
+
+    A producer thread writes the tar into a small bounded queue, so at most a
+    few chunks of the context are in memory however large it is.
+    """
+    chunks: queue.Queue = queue.Queue(maxsize=4)
+    finished = threading.Event()
+    writer = _QueueWriter(chunks, chunk_size, cancelled, finished)
+
+    def produce():
+        try:
+            with tarfile.open(fileobj=writer, mode="w|") as tar:
+                for path in snapshot.paths:
+                    full_path = os.path.join(snapshot.context_path, path)
+                    snapshot.check(path, full_path)
+                    tar.add(full_path, arcname=path, recursive=False)
+            writer.flush_rest()
+            writer._put(_DONE)
+        except BuildCancelled:
+            pass
+        except Exception as e:
+            try:
+                writer._put(e)
+            except BuildCancelled:
+                pass
+
+    threading.Thread(target=produce, name="build-context", daemon=True).start()
+    try:
+        while True:
+            try:
+                item = chunks.get(timeout=0.5)
+            except queue.Empty:
+                if cancelled.is_set():
+                    raise BuildCancelled()
+                continue
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        finished.set()  # Releases the producer if the upload ended early
+
+
+class BuildJob:
+    """One image build, with a bounded log of progress events that any number of callers can follow."""
+
+    def __init__(self, tag: str, context_path: str, dockerfile: str, content_hash: Optional[str] = None, max_events: int = BUILD_LOG_LINES):
+        self.id = uuid.uuid4().hex
+        self.tag = tag
+        self.context_path = context_path
+        self.dockerfile = dockerfile
+        self.context_hash = content_hash  # Known once the context has been hashed
+        self.snapshot: Optional[ContextSnapshot] = None
+        self.coalesced_into: Optional[str] = None  # Job ID of the identical build this one follows
+        self.status = HASHING if content_hash is None else QUEUED
+        self.image_id: Optional[str] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.submissions = 1  # Requests coalesced into this job
+        self._events: deque = deque(maxlen=max_events)
+        self._seq = 0  # Total events ever published
+        self._changed = asyncio.Event()
+        self._stop = threading.Event()
+        self._response = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in FINAL_STATES
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "tag": self.tag,
+            "status": self.status,
+            "image_id": self.image_id,
+            "error": self.error,
+            "context_hash": self.context_hash,
+            "coalesced_into": self.coalesced_into,
+            "submissions": self.submissions,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+    def publish(self, event: dict):
+        self._events.append(event)
+        self._seq += 1
+        self._notify()
+
+    def finish(self, status: str, image_id: Optional[str] = None, error: Optional[str] = None):
+        self.status = status
+        self.image_id = image_id
+        self.error = error
+        self.finished_at = time.time()
+        self.publish({"status": status, "image_id": image_id, "error": error})
+
+    def cancel(self) -> bool:
+        """Cancels the job. Returns False if it had already finished."""
+        if self.done:
+            return False
+        self._stop.set()
+        if self.status in (HASHING, QUEUED) or self.coalesced_into is not None:
+            self.finish(CANCELLED)
+        elif self._response is not None:
+            try:
+                CancellableStream(iter(()), self._response).close()
+            except Exception:
+                self._response.close()
+        return True
+
+    async def wait(self):
+        while not self.done:
+            await self._next_change()
+
+    async def follow(self) -> AsyncIterator[dict]:
+        """Yields the retained progress events, then new ones until the job finishes."""
+        seq = 0
+        while True:
+            while True:
+                # Recomputed after every yield: events may fall out of the bounded log while the caller is paused
+                first = self._seq - len(self._events)
+                seq = max(seq, first)
+                if seq >= self._seq:
+                    break
+                yield self._events[seq - first]
+                seq += 1
+            if self.done:
+                return
+            await self._next_change()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _next_change(self):
+        await self._changed.wait()
+
+
+class BuildQueue:
+    """Runs build jobs on a bounded pool of workers, coalescing identical submissions.
+
+    A submission returns its job at once; the context is then read and
+    hashed by a small pool of hashing workers. A job whose content hash and
+    tag match a build that is already queued or running does not build
+    itself but follows that build, so simultaneous identical builds run
+    once. The context is streamed to the daemon as a tar of the hashed
+    snapshot, never materialized.
+    """
+
+    def __init__(
+        self,
+        docker_layer: AsyncDocker,
+        concurrency: int = BUILD_CONCURRENCY,
+        history: int = BUILD_JOB_HISTORY,
+        chunk_size: int = BUILD_CONTEXT_CHUNK_SIZE,
+        hash_concurrency: int = BUILD_HASH_CONCURRENCY,
+    ):
+        self._docker = docker_layer
+        self.concurrency = concurrency
+        self.hash_concurrency = hash_concurrency
+        self.history = history
+        self.chunk_size = chunk_size
+        self._jobs: "OrderedDict[str, BuildJob]" = OrderedDict()
+        self._active: Dict[Tuple[str, str], BuildJob] = {}
+        self._hash_queue: asyncio.Queue = asyncio.Queue()
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._hash_executor = ThreadPoolExecutor(max_workers=hash_concurrency, thread_name_prefix="build-hash")
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="build")
+        self._workers: List[asyncio.Task] = []
+        self._followers: Set[asyncio.Task] = set()
+
+    def start(self):
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._hasher()) for _ in range(self.hash_concurrency)]
+            self._workers += [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for job in list(self._jobs.values()):
+            job.cancel()
+        tasks = self._workers + list(self._followers)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._hash_executor.shutdown(wait=False, cancel_futures=True)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    @property
+    def queue_depth(self) -> int:
+        """Jobs waiting for a free build worker."""
+        return self._queue.qsize()
+
+    def get(self, job_id: str) -> Optional[BuildJob]:
+        return self._jobs.get(job_id)
+
+    def list(self) -> List[BuildJob]:
+        return list(self._jobs.values())
+
+    async def submit(self, context_path: str, tag: str, dockerfile: str = "Dockerfile") -> BuildJob:
+        """Queues a build for hashing and returns its job right away."""
+        job = BuildJob(tag, context_path, dockerfile)
+        self._jobs[job.id] = job
+        self._trim()
+        self._hash_queue.put_nowait(job)
+        return job
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(0, len(self._jobs) - self.history)]:
+            del self._jobs[job_id]
+
+    async def _hasher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._hash_queue.get()
+            if job.done:  # Cancelled while waiting
+                continue
+            try:
+                # Reads the whole context, so it runs on its own bounded threads, off the loop and the build workers
+                snapshot = await loop.run_in_executor(self._hash_executor, ContextSnapshot, job.context_path, job.dockerfile)
+            except Exception as e:
+                if not job.done:
+                    job.finish(FAILED, error=f"Error reading build context: {e}")
+                continue
+            if job.done:
+                continue
+            job.snapshot, job.context_hash = snapshot, snapshot.hash
+            key = (snapshot.hash, job.tag)
+            original = self._active.get(key)
+            if original is not None and not original.done:
+                task = asyncio.create_task(self._follow(job, original))
+                self._followers.add(task)
+                task.add_done_callback(self._followers.discard)
+                continue
+            self._active[key] = job
+            job.status = QUEUED
+            job.publish({"status": QUEUED, "context_hash": snapshot.hash})
+            self._queue.put_nowait(job)
+
+    async def _follow(self, job: BuildJob, original: BuildJob):
+        """Reports an identical build's progress and outcome as the duplicate job's own."""
+        original.submissions += 1
+        job.coalesced_into = original.id
+        job.status = original.status
+        job.started_at = original.started_at
+        job.publish({"status": job.status, "coalesced_into": original.id})
+        async for event in original.follow():
+            if job.done:  # Cancelled; the original build carries on
+                return
+            if event.get("status") in FINAL_STATES and "image_id" in event:
+                break
+            if event.get("status") == RUNNING:
+                job.status, job.started_at = RUNNING, original.started_at
+            job.publish(event)
+        if not job.done:
+            job.finish(original.status, image_id=original.image_id, error=original.error)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            if job.status != QUEUED:  # Cancelled while waiting
+                self._release(job)
+                continue
+            job.status = RUNNING
+            job.started_at = time.time()
+            job.publish({"status": RUNNING})
+            loop = asyncio.get_running_loop()
+            try:
+                image_id, error = await loop.run_in_executor(self._executor, self._build, job, loop)
+                if job._stop.is_set():
+                    job.finish(CANCELLED)
+                elif error:
+                    job.finish(FAILED, error=error)
+                else:
+                    job.finish(SUCCEEDED, image_id=image_id)
+            except asyncio.CancelledError:  # Worker stopped mid-build
+                job.cancel()
+                job.finish(CANCELLED)
+                raise
+            except Exception as e:
+                job.finish(CANCELLED if job._stop.is_set() else FAILED, error=None if job._stop.is_set() else str(e))
+            finally:
+                if job.finished_at is not None:
+                    observe_docker_call("images.build", job.status, job.finished_at - job.started_at, job.started_at - job.created_at)
+                self._release(job)
+
+    def _release(self, job: BuildJob):
+        key = (job.context_hash, job.tag)
+        if self._active.get(key) is job:
+            del self._active[key]
+        self._trim()
+
+    def _build(self, job: BuildJob, loop: asyncio.AbstractEventLoop) -> Tuple[Optional[str], Optional[str]]:
+        """Runs one build against the daemon. Runs in a build worker thread.
+
+        ``api.build()`` hides the response, which cancellation has to close,
+        so this uses the SDK's request helpers; like ``exclude_paths`` and
+        ``CancellableStream`` they are not public API, and requirements.txt
+        pins the docker major version they were checked against.
+        """
+        api = self._docker.client.api
+        headers = {"Content-Type": "application/tar"}
+        api._set_auth_headers(headers)
+        job._response = api._post(
+            api._url("/build"),
+            params={"t": job.tag, "dockerfile": job.dockerfile, "rm": True},
+            data=stream_context(job.snapshot, self.chunk_size, job._stop),
+            headers=headers,
+            stream=True,
+            timeout=DOCKER_BUILD_TIMEOUT,
+        )
+        api._raise_for_status(job._response)
+
+        image_id, error = None, None
+        for event in api._stream_helper(job._response, decode=True):
+            if "aux" in event and isinstance(event["aux"], dict) and "ID" in event["aux"]:
+                image_id = event["aux"]["ID"]
+            elif "error" in event:
+                error = event["error"]
+            elif image_id is None and event.get("stream", "").startswith("Successfully built "):
+                image_id = event["stream"].split()[-1]
+            loop.call_soon_threadsafe(job.publish, event)
+        return image_id, error
+
+
+async def format_progress(job: BuildJob, format: str = "ndjson") -> AsyncIterator[bytes]:
+    """Streams a job's progress events as NDJSON lines or Server-Sent Events."""
+    async for event in job.follow():
+        if format == "sse":
+            yield f"data: {json.dumps(event)}\n\n".encode()
+        else:
+            yield (json.dumps(event) + "\n").encode()
+
+
+_builds: Optional[BuildQueue] = None
+
+
+def get_build_queue() -> BuildQueue:
+    """Returns the shared build queue, creating it on first use."""
+    global _builds
+    if _builds is None:
+        _builds = BuildQueue(get_docker())
+    return _builds
+
+
+def start_build_queue() -> BuildQueue:
+    """Starts the build workers. Called at application startup."""
+    builds = get_build_queue()
+    builds.start()
+    return builds
+
+
+async def stop_build_queue():
+    """Cancels running builds and stops the workers. Called at application shutdown."""
+    global _builds
+    if _builds is not None:
+        await _builds.stop()
+        _builds = None
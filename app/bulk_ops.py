@@ -0,0 +1,129 @@
+import asyncio
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from app.config import DOCKER_OP_TIMEOUT
+from app.container_index import get_container_index
+from app.fleet import HostUnavailableError, get_fleet, run_for_container
+from app.models.bulk import BulkOperation
+
+
+# Each action is a direct API call on the container ID or name, with no
+# containers.get lookup first
+def _start(api, target: str, stop_timeout: int, force: bool):
+    api.start(target)
+
+def _stop(api, target: str, stop_timeout: int, force: bool):
+    api.stop(target, timeout=stop_timeout)
+
+def _restart(api, target: str, stop_timeout: int, force: bool):
+    api.restart(target, timeout=stop_timeout)
+
+def _remove(api, target: str, stop_timeout: int, force: bool):
+    api.remove_container(target, force=force)
+
+def _stop_remove(api, target: str, stop_timeout: int, force: bool):
+    if not force:
+        api.stop(target, timeout=stop_timeout)
+    api.remove_container(target, force=force)
+
+
+ACTIONS = {
+    "start": _start,
+    "stop": _stop,
+    "restart": _restart,
+    "remove": _remove,
+    "stop_remove": _stop_remove,
+}
+
+
+async def resolve_targets(operation: BulkOperation) -> Tuple[List[str], Dict[str, str]]:
+    """Returns the de-duplicated IDs and names an operation applies to, and the errors of fleet hosts that were skipped.
+
+    IDs and names are passed to the daemon as given; a label selector is
+    resolved against the in-memory container index, or in fleet mode by
+    listing every host (which also tells the fleet where each one lives).
+    If a host does not answer, the label's matches there are unknown, so
+    this raises HostUnavailableError unless ``operation.allow_partial``.
+    """
+    targets = list(dict.fromkeys(operation.ids + operation.names))
+    host_errors: Dict[str, str] = {}
+    if operation.label is not None:
+        fleet = get_fleet()
+        if fleet is not None:
+            containers, errors = await fleet.list_containers(all=True, filters={"label": [operation.label]})
+            host_errors = {name: str(e) or type(e).__name__ for name, e in errors.items()}
+            if host_errors and not operation.allow_partial:
+                raise HostUnavailableError(
+                    "Could not list containers on every host: "
+                    + "; ".join(f"{name}: {error}" for name, error in host_errors.items())
+                )
+        else:
+            index = get_container_index()
+            await index.wait_ready()
+            containers, _ = index.query(label=operation.label)
+        seen = set(targets)
+        targets += [c["container_id"] for c in containers if c["container_id"] not in seen and c["container_name"] not in seen]
+    return targets, host_errors
+
+
+async def run_bulk(operation: BulkOperation, targets: List[str]) -> AsyncIterator[dict]:
+    """Applies an action to every target, at most ``operation.parallelism`` at a time.
+
+    The calls go through the daemon's bulk access layer (BULK_MAX_PARALLELISM
+    slots), so a large teardown neither caps at nor takes the slots that
+    API requests use.
+
+    Yields one result per target in completion order. Stopping iteration
+    early cancels whatever has not finished yet.
+    """
+    action = ACTIONS[operation.action]
+    semaphore = asyncio.Semaphore(operation.parallelism)
+    timeout = operation.timeout
+    if timeout is None:
+        timeout = DOCKER_OP_TIMEOUT + (operation.stop_timeout if operation.action != "start" else 0)
+
+    async def apply(target: str) -> dict:
+        async with semaphore:
+            started = time.monotonic()
+            try:
+                await run_for_container(
+                    target,
+                    lambda client: action(client.api, target, operation.stop_timeout, operation.force),
+                    op=f"containers.{operation.action}",
+                    timeout=timeout,
+                    bulk=True,
+                )
+                result = {"target": target, "status": "success"}
+            except Exception as e:
+                result = {"target": target, "status": "error", "error": str(e)}
+            result["elapsed"] = round(time.monotonic() - started, 3)
+            return result
+
+    tasks = [asyncio.create_task(apply(target)) for target in targets]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def bulk_results(operation: BulkOperation, targets: List[str], host_errors: Optional[Dict[str, str]] = None) -> AsyncIterator[dict]:
+    """Like run_bulk, followed by a final {"summary": ...} record that also names any skipped fleet hosts."""
+    started = time.monotonic()
+    succeeded = failed = 0
+    async for result in run_bulk(operation, targets):
+        if result["status"] == "success":
+            succeeded += 1
+        else:
+            failed += 1
+        yield {"action": operation.action, **result}
+    yield {"summary": {
+        "action": operation.action,
+        "total": len(targets),
+        "succeeded": succeeded,
+        "failed": failed,
+        "elapsed": round(time.monotonic() - started, 3),
+        **({"skipped_hosts": host_errors} if host_errors else {}),
+    }}
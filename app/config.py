@@ -6,3 +6,58 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "default-secret-key")  # Load from .env
 ALGORITHM = "HS256"  # JWT signing algorithm
 ACCESS_TOKEN_EXPIRE_MINUTES = 30  # Token expiry time (30 minutes)
+
+# Docker daemon access
+DOCKER_MAX_CONCURRENCY = int(os.getenv("DOCKER_MAX_CONCURRENCY", "16"))  # Parallel daemon calls
+DOCKER_POOL_SIZE = int(os.getenv("DOCKER_POOL_SIZE", "16"))  # Keep-alive connections to the daemon socket
+DOCKER_CLIENT_TIMEOUT = int(os.getenv("DOCKER_CLIENT_TIMEOUT", "60"))  # HTTP timeout of the SDK client (seconds)
+DOCKER_OP_TIMEOUT = float(os.getenv("DOCKER_OP_TIMEOUT", "30"))  # Default per-operation timeout (seconds)
+DOCKER_BUILD_TIMEOUT = float(os.getenv("DOCKER_BUILD_TIMEOUT", "1800"))  # Image builds may take much longer
+
+# Container index
+CONTAINER_INDEX_RESYNC_INTERVAL = float(os.getenv("CONTAINER_INDEX_RESYNC_INTERVAL", "60"))  # Full resync period (seconds)
+CONTAINER_INDEX_CHANGELOG_SIZE = int(os.getenv("CONTAINER_INDEX_CHANGELOG_SIZE", "10000"))  # Changes kept for delta queries
+
+# Log streaming
+LOG_STREAM_CHUNK_SIZE = int(os.getenv("LOG_STREAM_CHUNK_SIZE", "65536"))  # Max bytes read from the daemon at once
+LOG_SUBSCRIBER_BUFFER = int(os.getenv("LOG_SUBSCRIBER_BUFFER", "64"))  # Chunks buffered per follower before it is dropped
+LOG_CATCHUP_BUFFER = int(os.getenv("LOG_CATCHUP_BUFFER", "4096"))  # Live chunks held per follower while its history is still being sent
+LOG_MAX_LINE_LENGTH = int(os.getenv("LOG_MAX_LINE_LENGTH", "65536"))  # Longer lines are split
+
+# Build jobs
+BUILD_CONCURRENCY = int(os.getenv("BUILD_CONCURRENCY", "2"))  # Builds running at once
+BUILD_HASH_CONCURRENCY = int(os.getenv("BUILD_HASH_CONCURRENCY", "2"))  # Build contexts read and hashed at once
+BUILD_JOB_HISTORY = int(os.getenv("BUILD_JOB_HISTORY", "200"))  # Finished jobs kept for status queries
+BUILD_LOG_LINES = int(os.getenv("BUILD_LOG_LINES", "5000"))  # Progress events kept per job
+BUILD_CONTEXT_CHUNK_SIZE = int(os.getenv("BUILD_CONTEXT_CHUNK_SIZE", "65536"))  # Tar bytes sent to the daemon at once
+
+# Bulk container operations
+BULK_DEFAULT_PARALLELISM = int(os.getenv("BULK_DEFAULT_PARALLELISM", "16"))  # Containers handled at once per request
+BULK_MAX_PARALLELISM = int(os.getenv("BULK_MAX_PARALLELISM", "64"))
+BULK_MAX_TARGETS = int(os.getenv("BULK_MAX_TARGETS", "1000"))  # Containers per request
+
+# Authentication
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))  # Verified tokens kept in memory
+AUTH_TOKEN_CACHE_TTL = float(os.getenv("AUTH_TOKEN_CACHE_TTL", "300"))  # Seconds before a cached token is re-verified
+AUTH_HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", "2"))  # Processes running bcrypt
+AUTH_HASH_MAX_PENDING = int(os.getenv("AUTH_HASH_MAX_PENDING", "32"))  # Hashing requests admitted before returning 503
+
+# Resource stats collector
+STATS_INTERVAL = float(os.getenv("STATS_INTERVAL", "10"))  # Seconds between samples of each running container
+STATS_CONNECTIONS = int(os.getenv("STATS_CONNECTIONS", "8"))  # Concurrent stats requests to the daemon
+STATS_TIERS = os.getenv("STATS_TIERS", "10:360,60:360,300:288")  # step_seconds:points per tier (1h of 10s, 6h of 1m, 24h of 5m)
+STATS_MAX_CONTAINERS = int(os.getenv("STATS_MAX_CONTAINERS", "2000"))  # Containers tracked at most
+
+# Instrumentation
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+METRICS_SLOW_SAMPLES = int(os.getenv("METRICS_SLOW_SAMPLES", "20"))  # Slowest requests kept; 0 disables sampling
+METRICS_SLOW_THRESHOLD = float(os.getenv("METRICS_SLOW_THRESHOLD", "0.5"))  # Seconds before a request is a sampling candidate
+METRICS_LOOP_LAG_INTERVAL = float(os.getenv("METRICS_LOOP_LAG_INTERVAL", "0.5"))  # Event loop probe period (seconds)
+
+# Fleet mode: several Docker hosts instead of the single daemon from DOCKER_HOST
+DOCKER_HOSTS = os.getenv("DOCKER_HOSTS", "")  # Comma-separated [name=]url, e.g. "a=tcp://10.0.0.1:2375,b=ssh://ops@b"; empty disables fleet mode
+FLEET_HOST_TIMEOUT = float(os.getenv("FLEET_HOST_TIMEOUT", "5"))  # Per-host timeout of calls fanned out to every host (seconds)
+FLEET_HEALTH_INTERVAL = float(os.getenv("FLEET_HEALTH_INTERVAL", "10"))  # Seconds between health checks of each host
+FLEET_UNHEALTHY_AFTER = int(os.getenv("FLEET_UNHEALTHY_AFTER", "2"))  # Failed checks in a row before a host is skipped
+FLEET_PLACEMENT = os.getenv("FLEET_PLACEMENT", "least_loaded")  # least_loaded, consistent_hash or image_locality
+FLEET_ID_CACHE_SIZE = int(os.getenv("FLEET_ID_CACHE_SIZE", "100000"))  # Container ID and name -> host entries kept
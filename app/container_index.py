@@ -0,0 +1,310 @@
+import asyncio
+import bisect
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.config import CONTAINER_INDEX_RESYNC_INTERVAL, CONTAINER_INDEX_CHANGELOG_SIZE
+from app.docker_client import AsyncDocker, DockerTimeoutError, get_docker, container_record, image_tags_by_id
+
+logger = logging.getLogger(__name__)
+
+
+def record_matches(record: dict, status: Optional[str], label: Optional[str], image: Optional[str], name_prefix: Optional[str]) -> bool:
+    """Applies the container listing filters to one record."""
+    if status is not None and record["status"] != status:
+        return False
+    if label is not None:
+        key, sep, value = label.partition("=")
+        if key not in record["labels"] or (sep and record["labels"][key] != value):
+            return False
+    if image is not None:
+        tags = record["image_name"] if isinstance(record["image_name"], list) else []
+        if image not in tags and not any(tag.split(":", 1)[0] == image for tag in tags):
+            return False
+    if name_prefix is not None and not record["container_name"].startswith(name_prefix):
+        return False
+    return True
+
+
+class ContainerIndex:
+    """In-memory inventory of all containers, kept current from the Docker event stream.
+
+    A full listing seeds the index; afterwards only containers named in
+    events are refreshed, and a periodic full resync catches anything the
+    event stream missed. Image tags come from a cached image-ID map that is
+    only refetched when image events arrive. Every change bumps ``version`` and is recorded in a
+    bounded changelog so pollers can ask for what changed since a version.
+    """
+
+    def __init__(
+        self,
+        docker_layer: AsyncDocker,
+        resync_interval: float = CONTAINER_INDEX_RESYNC_INTERVAL,
+        changelog_size: int = CONTAINER_INDEX_CHANGELOG_SIZE,
+    ):
+        self._docker = docker_layer
+        self.resync_interval = resync_interval
+        self.version = 0
+        self.epoch = uuid.uuid4().hex[:8]  # Keeps ETags from colliding across restarts
+        self._containers: Dict[str, dict] = {}
+        self._image_tags: Dict[str, List[str]] = {}
+        self._sorted_ids: Optional[List[str]] = None
+        self._changelog: deque = deque(maxlen=changelog_size)  # (version, container_id)
+        self._ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stream = None
+
+    @property
+    def version_token(self) -> str:
+        """The version as handed to clients; the epoch keeps tokens from before a restart from matching."""
+        return f"{self.epoch}-{self.version}"
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.version_token}"'
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._close_stream()
+
+    async def wait_ready(self, timeout: Optional[float] = None):
+        """Waits for the initial listing. Raises DockerTimeoutError if it does not arrive in time."""
+        timeout = self._docker.default_timeout if timeout is None else timeout
+        try:
+            # Not wait_for: on 3.11 it swallows a cancellation that lands as the event is set,
+            # which left the stats scheduler impossible to stop
+            async with asyncio.timeout(timeout):
+                await self._ready.wait()
+        except TimeoutError:
+            raise DockerTimeoutError(f"Container index not ready after {timeout:g}s")
+
+    # Queries
+
+    def query(
+        self,
+        status: Optional[str] = None,
+        label: Optional[str] = None,
+        image: Optional[str] = None,
+        name_prefix: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> Tuple[List[dict], Optional[str]]:
+        """Returns matching containers ordered by ID, and the cursor for the next page (or None)."""
+        ids = self._ordered_ids()
+        start = bisect.bisect_right(ids, cursor) if cursor else 0
+        results = []
+        for i in range(start, len(ids)):
+            record = self._containers[ids[i]]
+            if not record_matches(record, status, label, image, name_prefix):
+                continue
+            if limit is not None and len(results) == limit:
+                return results, results[-1]["container_id"]
+            results.append(record)
+        return results, None
+
+    def changes_since(
+        self,
+        token: str,
+        status: Optional[str] = None,
+        label: Optional[str] = None,
+        image: Optional[str] = None,
+        name_prefix: Optional[str] = None,
+    ) -> Optional[Tuple[List[dict], List[str]]]:
+        """Returns (changed records, removed IDs) since the version named by a ``version_token``.
+
+        Returns None when the token is from another epoch (a previous
+        process), malformed, from the future, or older than the changelog
+        reaches, in which case the caller must fall back to a full listing.
+        Containers that stopped matching the filters are reported as removed.
+        """
+        epoch, _, number = token.rpartition("-")
+        if epoch != self.epoch or not number.isdigit():
+            return None
+        version = int(number)
+        if version > self.version:
+            return None
+        if version < self.version and (not self._changelog or self._changelog[0][0] > version + 1):
+            return None
+        changed_ids: Set[str] = set()
+        for change_version, container_id in reversed(self._changelog):
+            if change_version <= version:
+                break
+            changed_ids.add(container_id)
+        changed, removed = [], []
+        for container_id in sorted(changed_ids):
+            record = self._containers.get(container_id)
+            if record is not None and record_matches(record, status, label, image, name_prefix):
+                changed.append(record)
+            else:
+                removed.append(container_id)
+        return changed, removed
+
+    def _ordered_ids(self) -> List[str]:
+        if self._sorted_ids is None:
+            self._sorted_ids = sorted(self._containers)
+        return self._sorted_ids
+
+    # Maintenance
+
+    def _apply(self, container_id: str, record: Optional[dict]):
+        if self._containers.get(container_id) == record:
+            return
+        if record is None:
+            del self._containers[container_id]
+        else:
+            self._containers[container_id] = record
+        self._sorted_ids = None
+        self.version += 1
+        self._changelog.append((self.version, container_id))
+
+    def _apply_image_tags(self, image_tags: Dict[str, List[str]]):
+        if image_tags == self._image_tags:
+            return
+        self._image_tags = image_tags
+        for container_id, record in list(self._containers.items()):
+            image_name = image_tags.get(record["image_id"]) or "No image"
+            if image_name != record["image_name"]:
+                self._apply(container_id, {**record, "image_name": image_name})
+
+    async def _resync(self):
+        def fetch(client):
+            return image_tags_by_id(client), client.api.containers(all=True)
+
+        image_tags, summaries = await self._docker.run(fetch, op="containers.list")
+        self._apply_image_tags(image_tags)
+        current = {summary["Id"]: container_record(summary, image_tags) for summary in summaries}
+        for container_id in list(self._containers):
+            if container_id not in current:
+                self._apply(container_id, None)
+        for container_id, record in current.items():
+            self._apply(container_id, record)
+
+    async def _refresh(self, container_ids: Set[str], images_changed: bool):
+        known_tags = self._image_tags
+
+        def fetch(client):
+            image_tags = image_tags_by_id(client) if images_changed else known_tags
+            summaries = client.api.containers(all=True, filters={"id": list(container_ids)}) if container_ids else []
+            if not images_changed and any(summary["ImageID"] not in image_tags for summary in summaries):
+                image_tags = image_tags_by_id(client)
+            return image_tags, summaries
+
+        image_tags, summaries = await self._docker.run(fetch, op="containers.list")
+        self._apply_image_tags(image_tags)
+        records = {summary["Id"]: container_record(summary, image_tags) for summary in summaries}
+        for container_id in container_ids:
+            self._apply(container_id, records.get(container_id))
+
+    async def _run(self):
+        backoff = 1
+        while True:
+            try:
+                since = int(time.time())
+                await self._resync()
+                self._ready.set()
+                backoff = 1
+                await self._follow_events(since)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Container index lost sync with the daemon (%s); retrying in %ss", e, backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                self._close_stream()
+
+    async def _follow_events(self, since: int):
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        # Replays events from just before the seeding listing, so nothing falls in the gap
+        self._stream = await self._docker.run(
+            lambda client: client.events(since=since, decode=True, filters={"type": ["container", "image"]}),
+            op="events",
+        )
+        threading.Thread(target=self._pump, args=(self._stream, loop, queue), name="docker-events", daemon=True).start()
+
+        next_resync = loop.time() + self.resync_interval
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), max(0, next_resync - loop.time()))
+            except asyncio.TimeoutError:
+                await self._resync()
+                next_resync = loop.time() + self.resync_interval
+                continue
+            # Coalesce bursts (e.g. a compose stack starting) into one refresh
+            container_ids = set()
+            images_changed = False
+            while event is not None:
+                if event.get("Type") == "image":
+                    images_changed = True
+                elif not event.get("Action", "").startswith("exec_"):
+                    container_ids.add(event["Actor"]["ID"])
+                if queue.empty():
+                    break
+                event = queue.get_nowait()
+            if container_ids or images_changed:
+                await self._refresh(container_ids, images_changed)
+            if event is None:
+                raise ConnectionError("Docker event stream closed")
+
+    @staticmethod
+    def _pump(stream, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue):
+        """Feeds the blocking event stream into the event loop. Runs in its own thread."""
+        try:
+            for event in stream:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+        except Exception as e:
+            logger.debug("Docker event stream ended: %s", e)
+        finally:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, None)
+            except RuntimeError:  # Loop already closed during shutdown
+                pass
+
+    def _close_stream(self):
+        if self._stream is not None:
+            try:
+                self._stream.close()
+            except Exception:
+                pass
+            self._stream = None
+
+
+_index: Optional[ContainerIndex] = None
+
+
+def get_container_index() -> ContainerIndex:
+    """Returns the shared container index, creating it on first use."""
+    global _index
+    if _index is None:
+        _index = ContainerIndex(get_docker())
+    return _index
+
+
+async def start_container_index() -> ContainerIndex:
+    """Starts the background sync of the shared container index. Called at application startup."""
+    index = get_container_index()
+    await index.start()
+    return index
+
+
+async def stop_container_index():
+    """Stops the shared container index. Called at application shutdown."""
+    global _index
+    if _index is not None:
+        await _index.stop()
+        _index = None
@@ -0,0 +1,217 @@
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import docker
+
+from app.config import (
+    DOCKER_MAX_CONCURRENCY,
+    DOCKER_POOL_SIZE,
+    DOCKER_CLIENT_TIMEOUT,
+    DOCKER_OP_TIMEOUT,
+    BULK_MAX_PARALLELISM,
+)
+from app.metrics import observe_docker_call
+
+
+class DockerTimeoutError(Exception):
+    """Raised when a Docker operation does not finish within its timeout."""
+
+
+class AsyncDocker:
+    """Runs blocking docker SDK calls off the event loop.
+
+    The SDK client is created on first use inside a worker thread, so neither
+    startup nor the event loop ever waits on the daemon. Calls are limited to
+    ``max_concurrency`` at a time and share a pool of keep-alive connections
+    to the daemon socket.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = DOCKER_MAX_CONCURRENCY,
+        pool_size: int = DOCKER_POOL_SIZE,
+        client_timeout: int = DOCKER_CLIENT_TIMEOUT,
+        default_timeout: float = DOCKER_OP_TIMEOUT,
+        client_factory: Optional[Callable[[], docker.DockerClient]] = None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.default_timeout = default_timeout
+        self._client_factory = client_factory or functools.partial(
+            docker.from_env, max_pool_size=pool_size, timeout=client_timeout
+        )
+        self._client: Optional[docker.DockerClient] = None
+        self._client_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="docker")
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._running = 0  # Calls submitted to the worker threads and not finished yet
+        self._waiting = 0  # Calls waiting for a slot
+        self._abandoned = 0  # Running calls whose caller already timed out
+
+    @property
+    def client(self) -> docker.DockerClient:
+        """The underlying synchronous client. Only touch it from a worker thread."""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self._client_factory()
+        return self._client
+
+    async def run(self, fn: Callable[..., Any], *args, op: str = "docker", timeout: Optional[float] = None, **kwargs) -> Any:
+        """Runs ``fn(client, *args, **kwargs)`` in the Docker thread pool.
+
+        Raises DockerTimeoutError if the call does not complete within
+        ``timeout`` seconds (``default_timeout`` when omitted). A worker
+        thread cannot be interrupted, so a timed-out call keeps its slot
+        until the thread actually returns; the daemon may still carry the
+        operation out.
+        """
+        timeout = self.default_timeout if timeout is None else timeout
+        call = functools.partial(self._call, fn, *args, **kwargs)
+        loop = asyncio.get_running_loop()
+        queued = time.perf_counter()
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            future = self._executor.submit(call)
+        except RuntimeError:  # Shut down
+            self._semaphore.release()
+            observe_docker_call(op, outcome, 0.0, started - queued)
+            raise
+        self._running += 1
+        future.add_done_callback(lambda _: self._call_soon(loop, self._finished))
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+            outcome = "ok"
+            return result
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            raise DockerTimeoutError(
+                f"Docker operation '{op}' timed out after {timeout:g}s; the daemon may still complete it"
+            )
+        finally:
+            if not future.done():  # Timed out or cancelled while the thread is still busy
+                self._abandoned += 1
+                future.add_done_callback(lambda _: self._call_soon(loop, self._abandoned_finished))
+            observe_docker_call(op, outcome, time.perf_counter() - started, started - queued)
+
+    @staticmethod
+    def _call_soon(loop: asyncio.AbstractEventLoop, callback: Callable[[], None]):
+        try:
+            loop.call_soon_threadsafe(callback)
+        except RuntimeError:  # The loop is closed; nothing is left to release slots for
+            pass
+
+    def _finished(self):
+        self._running -= 1
+        self._semaphore.release()
+
+    def _abandoned_finished(self):
+        self._abandoned -= 1
+
+    @property
+    def in_flight(self) -> int:
+        """Calls running in a worker thread, including ones whose caller timed out."""
+        return self._running
+
+    @property
+    def queue_depth(self) -> int:
+        """Calls waiting for a free slot."""
+        return self._waiting
+
+    @property
+    def abandoned(self) -> int:
+        """Calls still running in a worker thread after their caller timed out."""
+        return self._abandoned
+
+    def spawn(self, max_concurrency: int) -> "AsyncDocker":
+        """Returns a separate access layer to the same daemon, with its own threads, slots and connections.
+
+        For background work that must not take slots from request handling.
+        """
+        return AsyncDocker(max_concurrency=max_concurrency, default_timeout=self.default_timeout, client_factory=self._client_factory)
+
+    def _call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        return fn(self.client, *args, **kwargs)
+
+    def close(self):
+        """Shuts down the worker threads and releases the daemon connections."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+
+def image_tags_by_id(client: docker.DockerClient) -> Dict[str, List[str]]:
+    """Maps every image ID to its tags with a single daemon request."""
+    return {
+        image["Id"]: [tag for tag in image.get("RepoTags") or [] if tag != "<none>:<none>"]
+        for image in client.api.images()
+    }
+
+
+def container_record(summary: dict, image_tags: Dict[str, List[str]]) -> dict:
+    """Builds a container record from raw list summary data, joining image tags in memory."""
+    return {
+        "container_id": summary["Id"],
+        "container_name": summary["Names"][0].lstrip("/") if summary.get("Names") else summary["Id"][:12],
+        "image_name": image_tags.get(summary["ImageID"]) or "No image",
+        "image_id": summary["ImageID"],
+        "status": summary["State"],
+        "labels": summary.get("Labels") or {},
+    }
+
+
+def list_containers(client: docker.DockerClient, all: bool = False, filters: Optional[dict] = None) -> List[dict]:
+    """Lists containers as records in two daemon requests, however many containers there are.
+
+    Hydrating SDK Container objects and reading ``container.image.tags``
+    costs one extra request per container; the raw summaries plus one bulk
+    image listing carry everything the listings need.
+    """
+    image_tags = image_tags_by_id(client)
+    return [container_record(summary, image_tags) for summary in client.api.containers(all=all, filters=filters)]
+
+
+_docker: Optional[AsyncDocker] = None
+_bulk_docker: Optional[AsyncDocker] = None
+
+
+def init_docker(docker_layer: Optional[AsyncDocker] = None) -> AsyncDocker:
+    """Creates the shared Docker access layer, or adopts ``docker_layer``. Called once at application startup."""
+    global _docker
+    if _docker is None:
+        _docker = docker_layer or AsyncDocker()
+    return _docker
+
+
+def get_docker() -> AsyncDocker:
+    """Returns the shared Docker access layer, creating it if startup has not run."""
+    return _docker or init_docker()
+
+
+def get_bulk_docker() -> AsyncDocker:
+    """Returns the access layer for bulk operations: same daemon, own slots, so teardowns never starve API requests."""
+    global _bulk_docker
+    if _bulk_docker is None:
+        _bulk_docker = get_docker().spawn(BULK_MAX_PARALLELISM)
+    return _bulk_docker
+
+
+def close_docker():
+    """Tears down the shared Docker access layers. Called at application shutdown."""
+    global _docker, _bulk_docker
+    if _bulk_docker is not None:
+        _bulk_docker.close()
+        _bulk_docker = None
+    if _docker is not None:
+        _docker.close()
+        _docker = None
@@ -1,57 +1,103 @@
-import docker
+import os
+from app.build_jobs import get_build_queue, SUCCEEDED
+from app.bulk_ops import run_bulk
+from app.config import BULK_DEFAULT_PARALLELISM
+from app.docker_client import get_docker, list_containers
+from app.fleet import get_fleet, run_for_container
+from app.models.bulk import BulkOperation
 
-client = docker.from_env()
-
-def build_image(dockerfile_path: str, tag: str):
+async def build_image(dockerfile_path: str, tag: str):
     """Builds a Docker image from a given Dockerfile path and assigns a tag."""
     try:
-        image, logs = client.images.build(path=dockerfile_path, tag=tag)
-        return {"status": "success", "image_id": image.id}
+        if os.path.isdir(dockerfile_path):
+            context_path, dockerfile = dockerfile_path, "Dockerfile"
+        else:
+            context_path, dockerfile = os.path.split(os.path.abspath(dockerfile_path))
+        job = await get_build_queue().submit(context_path, tag, dockerfile)
+        await job.wait()
+        if job.status != SUCCEEDED:
+            return {"status": "error", "message": job.error or f"Build {job.status}"}
+        return {"status": "success", "image_id": job.image_id}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
-def run_container(image: str, name: str, ports: dict, env_vars: dict, detach: bool = True):
+async def run_container(image: str, name: str, ports: dict, env_vars: dict, detach: bool = True):
     """Runs a container with the given parameters."""
     try:
-        container = client.containers.run(
-            image, 
-            name=name, 
-            ports=ports, 
-            environment=env_vars, 
-            detach=detach
+        fleet = get_fleet()
+        if fleet is not None:
+            host, container = await fleet.run_container(image, name=name, ports=ports, environment=env_vars, detach=detach)
+            return {"status": "success", "container_id": container.id, "host": host.name}
+        container = await get_docker().run(
+            lambda client: client.containers.run(
+                image,
+                name=name,
+                ports=ports,
+                environment=env_vars,
+                detach=detach
+            ),
+            op="containers.run",
         )
         return {"status": "success", "container_id": container.id}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
-def get_running_containers():
-    """Fetches all currently running containers."""
-    containers = client.containers.list()
-    return [{"id": c.id, "name": c.name, "image": c.image.tags} for c in containers]
+async def get_running_containers():
+    """Fetches all currently running containers; in fleet mode, from every host that answers."""
+    fleet = get_fleet()
+    if fleet is not None:
+        containers, _ = await fleet.list_containers()
+    else:
+        containers = await get_docker().run(list_containers, op="containers.list")
+    return [
+        {"id": c["container_id"], "name": c["container_name"], "image": c["image_name"] if isinstance(c["image_name"], list) else [],
+         **({"host": c["host"]} if "host" in c else {})}
+        for c in containers
+    ]
+
+async def get_container_logs(container_id: str, tail: int = 100):
+    """Fetches the last lines of logs from a container (100 by default).
 
-def get_container_logs(container_id: str):
-    """Fetches the last 100 lines of logs from a container."""
+    Use app.log_streams for large or live output.
+    """
     try:
-        container = client.containers.get(container_id)
-        logs = container.logs(tail=100).decode("utf-8")
-        return {"status": "success", "logs": logs}
+        logs = await run_for_container(
+            container_id,
+            lambda client: client.containers.get(container_id).logs(tail=tail),
+            op="containers.logs",
+        )
+        return {"status": "success", "logs": logs.decode("utf-8")}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
-def stop_and_remove_container(container_id: str):
+async def stop_and_remove_container(container_id: str):
     """Stops and removes a container by ID."""
-    try:
+    def stop_and_remove(client):
         container = client.containers.get(container_id)
         container.stop()
         container.remove()
+
+    try:
+        await run_for_container(container_id, stop_and_remove, op="containers.stop_remove")
         return {"status": "success", "message": f"Container {container_id} removed."}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
-def create_named_volume(volume_name: str):
-    """Creates a named Docker volume."""
+async def stop_and_remove_containers(container_ids: list, parallelism: int = BULK_DEFAULT_PARALLELISM):
+    """Stops and removes many containers in parallel, returning one result per container."""
+    operation = BulkOperation(action="stop_remove", ids=container_ids, parallelism=parallelism)
+    return [result async for result in run_bulk(operation, operation.ids)]
+
+async def create_named_volume(volume_name: str):
+    """Creates a named Docker volume; in fleet mode, on every host."""
     try:
-        volume = client.volumes.create(name=volume_name)
+        fleet = get_fleet()
+        if fleet is not None:
+            created, errors = await fleet.scatter(lambda client: client.volumes.create(name=volume_name), op="volumes.create")
+            if not created:
+                return {"status": "error", "message": "; ".join(f"{name}: {e}" for name, e in errors.items())}
+            return {"status": "success", "volume_name": volume_name, "hosts": list(created)}
+        volume = await get_docker().run(lambda client: client.volumes.create(name=volume_name), op="volumes.create")
         return {"status": "success", "volume_name": volume.name}
     except Exception as e:
         return {"status": "error", "message": str(e)}
@@ -0,0 +1,470 @@
+import asyncio
+import bisect
+import functools
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+import docker
+from docker.errors import NotFound
+
+from app.config import (
+    DOCKER_HOSTS,
+    BULK_MAX_PARALLELISM,
+    DOCKER_POOL_SIZE,
+    DOCKER_CLIENT_TIMEOUT,
+    FLEET_HOST_TIMEOUT,
+    FLEET_HEALTH_INTERVAL,
+    FLEET_UNHEALTHY_AFTER,
+    FLEET_PLACEMENT,
+    FLEET_ID_CACHE_SIZE,
+)
+from app.container_index import record_matches
+from app.docker_client import AsyncDocker, get_docker, get_bulk_docker, list_containers
+from app.log_streams import LogHub, get_log_hub
+
+logger = logging.getLogger(__name__)
+
+
+class HostUnavailableError(Exception):
+    """Raised when no host that could serve a call is healthy or answering."""
+
+
+def parse_hosts(spec: str) -> List[Tuple[str, str]]:
+    """Parses "name=url,url,..." into [(name, url), ...]; unnamed hosts are named after their address."""
+    hosts = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, sep, url = part.partition("=")
+        if not sep:
+            url = part
+            name = urlsplit(url).netloc or urlsplit(url).path
+        hosts.append((name.strip(), url.strip()))
+    names = [name for name, _ in hosts]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate Docker host names in DOCKER_HOSTS: {spec}")
+    return hosts
+
+
+def normalize_image(image: str) -> str:
+    """Adds the implicit :latest tag, like the daemon does."""
+    if image.startswith("sha256:") or "@" in image or ":" in image.rsplit("/", 1)[-1]:
+        return image
+    return image + ":latest"
+
+
+class DockerHost:
+    """One daemon of the fleet, with its own access layer (threads and connection pool) and health state.
+
+    Health checks double as the load and image inventory used for placement,
+    so placing a container costs no extra daemon requests.
+    """
+
+    def __init__(self, name: str, url: str, unhealthy_after: int = FLEET_UNHEALTHY_AFTER):
+        self.name = name
+        self.url = url
+        self.unhealthy_after = unhealthy_after
+        self.docker = AsyncDocker(client_factory=functools.partial(
+            docker.DockerClient, base_url=url, max_pool_size=DOCKER_POOL_SIZE, timeout=DOCKER_CLIENT_TIMEOUT
+        ))
+        self.healthy = True  # Until checks say otherwise
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self.checked_at: Optional[float] = None
+        self.running = 0  # Running containers at the last check
+        self.placed = 0  # Containers placed here since the last check
+        self.images: Set[str] = set()  # Image tags and IDs at the last check
+        self._log_hub: Optional[LogHub] = None
+        self._bulk_docker: Optional[AsyncDocker] = None
+
+    @property
+    def load(self) -> int:
+        return self.running + self.placed
+
+    @property
+    def log_hub(self) -> LogHub:
+        if self._log_hub is None:
+            self._log_hub = LogHub(self.docker)
+        return self._log_hub
+
+    @property
+    def bulk_docker(self) -> AsyncDocker:
+        """Separate slots for bulk operations on this host."""
+        if self._bulk_docker is None:
+            self._bulk_docker = self.docker.spawn(BULK_MAX_PARALLELISM)
+        return self._bulk_docker
+
+    def has_image(self, image: str) -> bool:
+        return normalize_image(image) in self.images or image in self.images
+
+    async def check(self, timeout: float):
+        def probe(client):
+            return client.api.info(), client.api.images()
+
+        try:
+            info, images = await self.docker.run(probe, op="fleet.health", timeout=timeout)
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e) or type(e).__name__
+            if self.healthy and self.failures >= self.unhealthy_after:
+                self.healthy = False
+                logger.warning("Docker host %s is unhealthy: %s", self.name, self.last_error)
+        else:
+            if not self.healthy:
+                logger.info("Docker host %s is healthy again", self.name)
+            self.healthy = True
+            self.failures = 0
+            self.last_error = None
+            self.running = info.get("ContainersRunning", 0)
+            self.placed = 0
+            self.images = {tag for image in images for tag in image.get("RepoTags") or [] if tag != "<none>:<none>"}
+            self.images.update(image["Id"] for image in images)
+        self.checked_at = time.time()
+
+    def status(self) -> dict:
+        return {
+            "name": self.name,
+            "url": self.url,
+            "healthy": self.healthy,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "checked_at": self.checked_at,
+            "running": self.running,
+            "placed": self.placed,
+            "images": len(self.images),
+            "calls_in_flight": self.docker.in_flight,
+            "calls_queued": self.docker.queue_depth,
+        }
+
+    def close(self):
+        if self._bulk_docker is not None:
+            self._bulk_docker.close()
+        self.docker.close()
+
+
+class HostIndex:
+    """Bounded LRU map from container IDs and names to the name of the host that owns them."""
+
+    def __init__(self, max_size: int = FLEET_ID_CACHE_SIZE):
+        self.max_size = max_size
+        self._hosts: "OrderedDict[str, str]" = OrderedDict()
+
+    def __contains__(self, ref: str) -> bool:
+        return ref in self._hosts
+
+    def get(self, ref: str) -> Optional[str]:
+        host = self._hosts.get(ref)
+        if host is not None:
+            self._hosts.move_to_end(ref)
+        return host
+
+    def put(self, ref: str, host: str):
+        self._hosts[ref] = host
+        self._hosts.move_to_end(ref)
+        while len(self._hosts) > self.max_size:
+            self._hosts.popitem(last=False)
+
+    def forget(self, ref: str):
+        self._hosts.pop(ref, None)
+
+    def learn(self, records: List[dict], host: str):
+        for record in records:
+            self.put(record["container_id"], host)
+            self.put(record["container_name"], host)
+
+
+# Placement strategies pick a host for a new container from the healthy hosts,
+# given its image and optional name
+
+PlacementStrategy = Callable[[List[DockerHost], str, Optional[str]], DockerHost]
+
+
+def least_loaded(hosts: List[DockerHost], image: str, name: Optional[str]) -> DockerHost:
+    return min(hosts, key=lambda host: (host.load, host.name))
+
+
+class HashRing:
+    """Consistent hash ring with virtual nodes; removing a host only moves the keys it owned."""
+
+    def __init__(self, names: Tuple[str, ...], replicas: int = 100):
+        self._ring = sorted((self._hash(f"{name}#{i}"), name) for name in names for i in range(replicas))
+        self._keys = [point for point, _ in self._ring]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+    def lookup(self, key: str) -> str:
+        i = bisect.bisect(self._keys, self._hash(key)) % len(self._ring)
+        return self._ring[i][1]
+
+
+@functools.lru_cache(maxsize=32)
+def _ring(names: Tuple[str, ...]) -> HashRing:
+    return HashRing(names)
+
+
+def consistent_hash(hosts: List[DockerHost], image: str, name: Optional[str]) -> DockerHost:
+    if name is None:
+        return least_loaded(hosts, image, name)
+    owner = _ring(tuple(sorted(host.name for host in hosts))).lookup(name)
+    return next(host for host in hosts if host.name == owner)
+
+
+def image_locality(hosts: List[DockerHost], image: str, name: Optional[str]) -> DockerHost:
+    return least_loaded([host for host in hosts if host.has_image(image)] or hosts, image, name)
+
+
+PLACEMENT_STRATEGIES: Dict[str, PlacementStrategy] = {
+    "least_loaded": least_loaded,
+    "consistent_hash": consistent_hash,
+    "image_locality": image_locality,
+}
+
+
+def register_placement(name: str, strategy: PlacementStrategy):
+    """Makes a custom placement strategy selectable through FLEET_PLACEMENT."""
+    PLACEMENT_STRATEGIES[name] = strategy
+
+
+class Fleet:
+    """A pool of Docker hosts used as one.
+
+    Listings fan out to every healthy host at once, each with its own
+    timeout, and return whatever the answering hosts sent along with the
+    errors of the others. Calls on one container go only to its owner,
+    found through a cached ID/name -> host index that listings and
+    placements keep filling; a miss asks every host once and caches the
+    answer. New containers go where the placement strategy says.
+    """
+
+    def __init__(
+        self,
+        hosts: List[Tuple[str, str]],
+        host_timeout: float = FLEET_HOST_TIMEOUT,
+        health_interval: float = FLEET_HEALTH_INTERVAL,
+        unhealthy_after: int = FLEET_UNHEALTHY_AFTER,
+        placement: str = FLEET_PLACEMENT,
+        id_cache_size: int = FLEET_ID_CACHE_SIZE,
+    ):
+        if not hosts:
+            raise ValueError("Fleet mode needs at least one Docker host")
+        if placement not in PLACEMENT_STRATEGIES:
+            raise ValueError(f"Unknown placement strategy {placement!r}; choose from {', '.join(PLACEMENT_STRATEGIES)}")
+        self.hosts: Dict[str, DockerHost] = {name: DockerHost(name, url, unhealthy_after) for name, url in hosts}
+        self.primary = next(iter(self.hosts.values()))
+        self.host_timeout = host_timeout
+        self.health_interval = health_interval
+        self.placement = placement
+        self.ids = HostIndex(id_cache_size)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._health_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def close(self):
+        for host in self.hosts.values():
+            host.close()
+
+    async def check_health(self):
+        await asyncio.gather(*(host.check(self.host_timeout) for host in self.hosts.values()))
+
+    async def _health_loop(self):
+        while True:
+            try:
+                await self.check_health()
+            except Exception as e:
+                logger.warning("Fleet health check failed: %s", e)
+            await asyncio.sleep(self.health_interval)
+
+    def healthy_hosts(self) -> List[DockerHost]:
+        return [host for host in self.hosts.values() if host.healthy]
+
+    def status(self) -> List[dict]:
+        return [host.status() for host in self.hosts.values()]
+
+    # Scatter-gather
+
+    async def scatter(
+        self, fn: Callable[..., Any], op: str, timeout: Optional[float] = None
+    ) -> Tuple[Dict[str, Any], Dict[str, Exception]]:
+        """Runs ``fn(client)`` on every healthy host at once.
+
+        Returns (results by host, errors by host). A host that fails or
+        misses its ``timeout`` only loses its own part of the answer;
+        unhealthy hosts are reported as errors without being called.
+        """
+        timeout = self.host_timeout if timeout is None else timeout
+        errors: Dict[str, Exception] = {
+            host.name: HostUnavailableError(f"Docker host {host.name} is unhealthy: {host.last_error}")
+            for host in self.hosts.values() if not host.healthy
+        }
+        live = self.healthy_hosts()
+        outcomes = await asyncio.gather(*(host.docker.run(fn, op=op, timeout=timeout) for host in live), return_exceptions=True)
+        results = {}
+        for host, outcome in zip(live, outcomes):
+            if isinstance(outcome, Exception):
+                errors[host.name] = outcome
+            else:
+                results[host.name] = outcome
+        return results, errors
+
+    async def list_containers(self, all: bool = False, filters: Optional[dict] = None) -> Tuple[List[dict], Dict[str, Exception]]:
+        """Container records from every answering host, each with a ``host`` key, plus the errors of the rest."""
+        results, errors = await self.scatter(functools.partial(list_containers, all=all, filters=filters), op="containers.list")
+        records = []
+        for name, host_records in results.items():
+            self.ids.learn(host_records, name)
+            records += [{**record, "host": name} for record in host_records]
+        return records, errors
+
+    async def query_containers(
+        self,
+        status: Optional[str] = None,
+        label: Optional[str] = None,
+        image: Optional[str] = None,
+        name_prefix: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> Tuple[List[dict], Optional[str], Dict[str, Exception]]:
+        """Like ContainerIndex.query across the fleet, plus the errors of hosts that did not answer."""
+        filters = {}
+        if status is not None:
+            filters["status"] = [status]
+        if label is not None:
+            filters["label"] = [label]
+        records, errors = await self.list_containers(all=True, filters=filters or None)
+        records = sorted(
+            (r for r in records if record_matches(r, status, label, image, name_prefix) and (cursor is None or r["container_id"] > cursor)),
+            key=lambda r: r["container_id"],
+        )
+        if limit is not None and len(records) > limit:
+            return records[:limit], records[limit - 1]["container_id"], errors
+        return records, None, errors
+
+    # Routing by container
+
+    async def locate(self, ref: str) -> DockerHost:
+        """Returns the host owning a container ID or name. Raises NotFound if no host has it."""
+        name = self.ids.get(ref)
+        if name is not None and name in self.hosts:
+            return self.hosts[name]
+        results, errors = await self.scatter(lambda client: client.api.inspect_container(ref), op="containers.inspect")
+        for name, document in results.items():
+            self.ids.put(ref, name)
+            self.ids.put(document["Id"], name)
+            return self.hosts[name]
+        unreachable = sorted(name for name, e in errors.items() if not isinstance(e, NotFound))
+        if unreachable:
+            raise HostUnavailableError(f"Container {ref} is not on any answering host; no answer from {', '.join(unreachable)}")
+        raise NotFound(f"No such container: {ref}")
+
+    async def run_on_owner(
+        self, ref: str, fn: Callable[..., Any], op: str, timeout: Optional[float] = None, bulk: bool = False
+    ) -> Tuple[DockerHost, Any]:
+        """Runs ``fn(client)`` on the host owning a container, through its bulk slots if ``bulk``.
+
+        If a cached owner no longer has the container, the entry is dropped
+        and the container located once more.
+        """
+        def layer(host: DockerHost) -> AsyncDocker:
+            return host.bulk_docker if bulk else host.docker
+
+        cached = ref in self.ids
+        host = await self.locate(ref)
+        try:
+            return host, await layer(host).run(fn, op=op, timeout=timeout)
+        except NotFound:
+            self.ids.forget(ref)
+            if not cached:
+                raise
+        host = await self.locate(ref)
+        return host, await layer(host).run(fn, op=op, timeout=timeout)
+
+    # Placement
+
+    def place(self, image: str, name: Optional[str] = None, strategy: Optional[str] = None) -> DockerHost:
+        candidates = self.healthy_hosts()
+        if not candidates:
+            raise HostUnavailableError("No healthy Docker hosts to place the container on")
+        host = PLACEMENT_STRATEGIES[strategy or self.placement](candidates, image, name)
+        host.placed += 1
+        return host
+
+    async def run_container(self, image: str, name: Optional[str] = None, **kwargs) -> Tuple[DockerHost, Any]:
+        """Places a new container and runs it. Returns its host and the SDK container."""
+        host = self.place(image, name)
+        try:
+            container = await host.docker.run(lambda client: client.containers.run(image, name=name, **kwargs), op="containers.run")
+        except Exception:
+            host.placed -= 1
+            raise
+        self.ids.put(container.id, host.name)
+        if name:
+            self.ids.put(name, host.name)
+        host.images.add(normalize_image(image))
+        return host, container
+
+
+_fleet: Optional[Fleet] = None
+
+
+def get_fleet() -> Optional[Fleet]:
+    """Returns the fleet when DOCKER_HOSTS configures one, else None (single-daemon mode)."""
+    global _fleet
+    if _fleet is None and DOCKER_HOSTS.strip():
+        _fleet = Fleet(parse_hosts(DOCKER_HOSTS))
+    return _fleet
+
+
+def start_fleet() -> Optional[Fleet]:
+    """Starts health checking the fleet, if there is one. Called at application startup."""
+    fleet = get_fleet()
+    if fleet is not None:
+        fleet.start()
+    return fleet
+
+
+async def stop_fleet():
+    """Stops health checks and closes every host's connections. Called at application shutdown."""
+    global _fleet
+    if _fleet is not None:
+        await _fleet.stop()
+        _fleet.close()
+        _fleet = None
+
+
+async def run_for_container(container_id: str, fn: Callable[..., Any], op: str, timeout: Optional[float] = None, bulk: bool = False) -> Any:
+    """Runs ``fn(client)`` against the daemon that owns a container: the single daemon, or its fleet host.
+
+    ``bulk`` calls use that daemon's separate bulk slots instead of the request path's.
+    """
+    fleet = get_fleet()
+    if fleet is None:
+        return await (get_bulk_docker() if bulk else get_docker()).run(fn, op=op, timeout=timeout)
+    _, result = await fleet.run_on_owner(container_id, fn, op=op, timeout=timeout, bulk=bulk)
+    return result
+
+
+async def log_hub_for(container_id: str) -> LogHub:
+    """The log hub of the daemon that owns a container."""
+    fleet = get_fleet()
+    if fleet is None:
+        return get_log_hub()
+    host = await fleet.locate(container_id)
+    return get_log_hub() if host is fleet.primary else host.log_hub
@@ -0,0 +1,463 @@
+import asyncio
+import codecs
+import concurrent.futures
+import json
+import logging
+import struct
+import threading
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from docker.types.daemon import CancellableStream
+
+from app.config import LOG_STREAM_CHUNK_SIZE, LOG_SUBSCRIBER_BUFFER, LOG_CATCHUP_BUFFER, LOG_MAX_LINE_LENGTH
+from app.docker_client import AsyncDocker, get_docker
+
+logger = logging.getLogger(__name__)
+
+STREAM_NAMES = {0: "stdin", 1: "stdout", 2: "stderr"}
+_HEADER = struct.Struct(">BxxxL")
+
+_EOF = object()
+
+
+class LogStreamLagged(Exception):
+    """Raised to a follower that fell too far behind a shared log stream."""
+
+
+class FrameDemuxer:
+    """Incrementally splits Docker's multiplexed stdout/stderr framing.
+
+    Each frame is an 8-byte header (stream type, 3 padding bytes, big-endian
+    payload length) followed by the payload. Payload bytes are handed out as
+    soon as they arrive, so a large frame is never buffered whole.
+    """
+
+    def __init__(self):
+        self._header = b""
+        self._stream = "stdout"
+        self._remaining = 0
+
+    def feed(self, data: bytes) -> List[Tuple[str, bytes]]:
+        pieces = []
+        pos = 0
+        while pos < len(data):
+            if self._remaining == 0:
+                needed = _HEADER.size - len(self._header)
+                self._header += data[pos:pos + needed]
+                pos += needed
+                if len(self._header) < _HEADER.size:
+                    break
+                stream_type, self._remaining = _HEADER.unpack(self._header)
+                self._stream = STREAM_NAMES.get(stream_type, "stdout")
+                self._header = b""
+                continue
+            piece = data[pos:pos + self._remaining]
+            pos += len(piece)
+            self._remaining -= len(piece)
+            pieces.append((self._stream, piece))
+        return pieces
+
+
+class _LiveQueue(asyncio.Queue):
+    """A follower's queue on a shared stream.
+
+    Live output arrives while the follower's history is still being sent, so
+    until ``caught_up()`` the queue holds up to ``catchup_size`` chunks before
+    it counts as full. After that the backlog it holds is allowed to drain:
+    the queue is full only when it grows by another ``maxsize`` chunks, and
+    the normal limit applies again once it is back under ``maxsize``.
+    """
+
+    def __init__(self, maxsize: int, catchup_size: int):
+        super().__init__(maxsize)
+        self._limit = max(maxsize, catchup_size)
+        self._catching_up = True
+
+    def caught_up(self):
+        if self._catching_up:
+            self._catching_up = False
+            self._limit = max(self.maxsize, self.qsize() + self.maxsize)
+
+    def full(self) -> bool:
+        if not self._catching_up and self.qsize() < self.maxsize:
+            self._limit = self.maxsize
+        return self.qsize() >= self._limit
+
+
+class _Upstream:
+    """One log request to the daemon, fanned out to its subscribers.
+
+    A dedicated thread reads the response and hands each chunk to the event
+    loop, waiting until it has been delivered. Exclusive streams wait for
+    their single subscriber to make room, which pushes back on the daemon
+    socket. Shared streams never wait on a subscriber: one whose buffer is
+    full is dropped with LogStreamLagged instead.
+    """
+
+    def __init__(self, hub: "LogHub", key: Optional[tuple]):
+        self._hub = hub
+        self.key = key  # None for exclusive streams
+        self.subscribers: List[asyncio.Queue] = []
+        self._response = None
+        self._response_lock = threading.Lock()
+        self._abandoned = False  # The caller stopped waiting for the response
+        self._pending: Optional[concurrent.futures.Future] = None
+        self._closed = False
+        self.connected = asyncio.get_running_loop().create_future()
+
+    @property
+    def shared(self) -> bool:
+        return self.key is not None
+
+    async def connect(self, container_id: str, params: dict):
+        try:
+            tty = await self._hub.docker.run(self._open, container_id, params, op="containers.logs")
+        except asyncio.CancelledError:
+            self._abandon()
+            self.connected.cancel()
+            raise
+        except Exception as e:
+            self._abandon()
+            self.connected.set_exception(e)
+            self.connected.exception()  # Mark retrieved; waiters re-raise it themselves
+            raise
+        self.connected.set_result(None)
+        if self._closed:
+            self._cancel_response()
+            return
+        loop = asyncio.get_running_loop()
+        threading.Thread(target=self._read, args=(loop, tty), name=f"logs-{container_id[:12]}", daemon=True).start()
+
+    def _open(self, client, container_id: str, params: dict) -> bool:
+        """Opens the daemon response in a worker thread. Closes it instead if the caller already gave up on it."""
+        response, tty = _open_logs(client, container_id, params)
+        with self._response_lock:
+            if not self._abandoned:
+                self._response = response
+                return tty
+        _close_response(response)  # Timed out or cancelled while connecting; a follow response would never close
+        return tty
+
+    def _abandon(self):
+        with self._response_lock:
+            self._abandoned = True
+        self._cancel_response()
+
+    def subscribe(self) -> asyncio.Queue:
+        if self.shared:
+            queue: asyncio.Queue = _LiveQueue(self._hub.buffer_size, self._hub.catchup_size)
+        else:
+            queue = asyncio.Queue(maxsize=self._hub.buffer_size)
+        self.subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        if queue in self.subscribers:
+            self.subscribers.remove(queue)
+        if not self.subscribers:
+            self.close()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._hub.forget(self)
+        if self._pending is not None:
+            self._pending.cancel()
+        self._cancel_response()
+
+    def _cancel_response(self):
+        if self._response is not None:
+            _close_response(self._response)
+
+    def _read(self, loop: asyncio.AbstractEventLoop, tty: bool):
+        demuxer = None if tty else FrameDemuxer()
+        try:
+            for chunk in self._response.raw.stream(self._hub.chunk_size, decode_content=False):
+                pieces = [("stdout", chunk)] if tty else demuxer.feed(chunk)
+                if not pieces:
+                    continue
+                self._pending = asyncio.run_coroutine_threadsafe(self._publish(pieces), loop)
+                self._pending.result()
+                if self._closed:
+                    break
+        except concurrent.futures.CancelledError:
+            pass
+        except Exception as e:
+            if not self._closed:
+                logger.debug("Log stream ended: %s", e)
+        finally:
+            try:
+                asyncio.run_coroutine_threadsafe(self._finish(), loop)
+            except RuntimeError:  # Loop already closed during shutdown
+                pass
+
+    async def _publish(self, pieces: List[Tuple[str, bytes]]):
+        for piece in pieces:
+            for queue in list(self.subscribers):
+                if not self.shared:
+                    await queue.put(piece)
+                    continue
+                try:
+                    queue.put_nowait(piece)
+                except asyncio.QueueFull:
+                    self.subscribers.remove(queue)
+                    _replace_with(queue, LogStreamLagged("Log follower fell behind and was disconnected"))
+            if not self.subscribers:
+                self.close()
+                return
+
+    async def _finish(self):
+        for queue in list(self.subscribers):
+            if not self.shared:
+                await queue.put(_EOF)
+            elif queue.full():
+                _replace_with(queue, LogStreamLagged("Log follower fell behind and was disconnected"))
+            else:
+                queue.put_nowait(_EOF)
+        self.subscribers = []
+        self.close()
+
+
+def _replace_with(queue: asyncio.Queue, item):
+    """Drops whatever a queue still holds and leaves only ``item`` in it."""
+    while not queue.empty():
+        queue.get_nowait()
+    queue.put_nowait(item)
+
+
+def _close_response(response):
+    """Closes a streaming response, shutting down its socket so a blocked reader wakes up."""
+    try:
+        CancellableStream(iter(()), response).close()
+    except Exception:
+        response.close()
+
+
+def _open_logs(client, container_id: str, params: dict):
+    """Starts a raw log request. Returns the streaming response and whether the container has a TTY.
+
+    ``api.logs()`` hides the response and applies the client timeout to
+    follow requests, so this goes through the SDK's request helpers, which
+    are not public API; requirements.txt pins the docker major version.
+    """
+    tty = client.api.inspect_container(container_id)["Config"]["Tty"]
+    response = client.api._get(
+        client.api._url("/containers/{0}/logs", container_id),
+        params=params,
+        stream=True,
+        timeout=None if params.get("follow") else client.api.timeout,
+    )
+    client.api._raise_for_status(response)
+    return response, tty
+
+
+def _log_params(follow: bool, stdout: bool, stderr: bool, timestamps: bool, tail: Optional[int] = None,
+                since: Optional[float] = None, until: Optional[float] = None) -> dict:
+    params = {
+        "follow": int(follow),
+        "stdout": int(stdout),
+        "stderr": int(stderr),
+        "timestamps": int(timestamps),
+        "tail": "all" if tail is None else tail,
+    }
+    if since is not None:
+        params["since"] = f"{since:.9f}"
+    if until is not None:
+        params["until"] = f"{until:.9f}"
+    return params
+
+
+class LogSubscription:
+    """Async iterator over (stream name, bytes) pieces of a container's logs."""
+
+    def __init__(self, history: Optional[_Upstream], live: Optional[_Upstream]):
+        self._sources = [upstream for upstream in (history, live) if upstream is not None]
+        self._queues = {upstream: upstream.subscribe() for upstream in self._sources}
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self) -> AsyncIterator[Tuple[str, bytes]]:
+        try:
+            for upstream in self._sources:
+                await upstream.connected
+                queue = self._queues[upstream]
+                if isinstance(queue, _LiveQueue):
+                    queue.caught_up()  # History, if any, has been sent
+                while True:
+                    item = await queue.get()
+                    if item is _EOF:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    yield item
+        finally:
+            self.close()
+
+    def close(self):
+        for upstream, queue in self._queues.items():
+            upstream.unsubscribe(queue)
+        self._queues = {}
+
+
+class LogHub:
+    """Opens container log streams, sharing one daemon stream between followers.
+
+    Follow requests are split in two: the requested history (``tail``,
+    ``since``) is read with its own non-following request, and live output
+    comes from one following request per container and stream selection,
+    shared by every follower. Live output that arrives while a follower's
+    history is being sent waits in its (larger) catch-up buffer.
+    """
+
+    def __init__(
+        self,
+        docker_layer: AsyncDocker,
+        chunk_size: int = LOG_STREAM_CHUNK_SIZE,
+        buffer_size: int = LOG_SUBSCRIBER_BUFFER,
+        catchup_size: int = LOG_CATCHUP_BUFFER,
+    ):
+        self.docker = docker_layer
+        self.chunk_size = chunk_size
+        self.buffer_size = buffer_size
+        self.catchup_size = catchup_size
+        self._shared: Dict[tuple, _Upstream] = {}
+
+    @property
+    def shared_streams(self) -> int:
+        """Following daemon log streams currently open."""
+        return len(self._shared)
+
+    def forget(self, upstream: _Upstream):
+        if upstream.shared and self._shared.get(upstream.key) is upstream:
+            del self._shared[upstream.key]
+
+    async def open(
+        self,
+        container_id: str,
+        follow: bool = False,
+        tail: Optional[int] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        timestamps: bool = False,
+        stdout: bool = True,
+        stderr: bool = True,
+    ) -> LogSubscription:
+        """Connects to the daemon and returns a subscription to the requested logs.
+
+        Raises the daemon error (e.g. NotFound) before anything is streamed.
+        """
+        if not follow or until is not None:
+            history = _Upstream(self, None)
+            subscription = LogSubscription(history, None)
+            await self._connect(history, subscription, container_id, _log_params(False, stdout, stderr, timestamps, tail, since, until))
+            return subscription
+
+        key = (container_id, stdout, stderr, timestamps)
+        live = self._shared.get(key)
+        created = live is None
+        if created:
+            live = self._shared[key] = _Upstream(self, key)
+        now = time.time()
+        history = _Upstream(self, None) if tail != 0 else None
+        subscription = LogSubscription(history, live)
+        if created:
+            await self._connect(live, subscription, container_id, _log_params(True, stdout, stderr, timestamps, 0, now))
+        else:
+            try:
+                await asyncio.shield(live.connected)
+            except BaseException:
+                subscription.close()
+                raise
+        if history is not None:
+            await self._connect(history, subscription, container_id, _log_params(False, stdout, stderr, timestamps, tail, since, now))
+        return subscription
+
+    @staticmethod
+    async def _connect(upstream: _Upstream, subscription: LogSubscription, container_id: str, params: dict):
+        try:
+            await upstream.connect(container_id, params)
+        except BaseException:
+            subscription.close()
+            raise
+
+
+class LineSplitter:
+    """Decodes byte pieces of one stream into text lines, keeping at most one partial line."""
+
+    def __init__(self, max_line_length: int = LOG_MAX_LINE_LENGTH):
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._partial = ""
+        self._max = max_line_length
+
+    def feed(self, data: bytes) -> List[str]:
+        lines = (self._partial + self._decoder.decode(data)).split("\n")
+        self._partial = lines.pop()
+        while len(self._partial) > self._max:
+            lines.append(self._partial[:self._max])
+            self._partial = self._partial[self._max:]
+        return lines
+
+    def flush(self) -> List[str]:
+        rest = self._partial + self._decoder.decode(b"", final=True)
+        self._partial = ""
+        return [rest] if rest else []
+
+
+def _line_event(stream: str, line: str, timestamps: bool) -> dict:
+    event = {"stream": stream}
+    if timestamps:
+        timestamp, _, line = line.partition(" ")
+        event["timestamp"] = timestamp
+    event["line"] = line.rstrip("\r")
+    return event
+
+
+async def log_lines(subscription: LogSubscription, timestamps: bool = False) -> AsyncIterator[dict]:
+    """Turns a subscription into {"stream", "line"[, "timestamp"]} events."""
+    splitters: Dict[str, LineSplitter] = {}
+    async for stream, data in subscription:
+        splitter = splitters.get(stream) or splitters.setdefault(stream, LineSplitter())
+        for line in splitter.feed(data):
+            yield _line_event(stream, line, timestamps)
+    for stream, splitter in splitters.items():
+        for line in splitter.flush():
+            yield _line_event(stream, line, timestamps)
+
+
+async def format_text(subscription: LogSubscription) -> AsyncIterator[bytes]:
+    try:
+        async for _, data in subscription:
+            yield data
+    except LogStreamLagged as e:
+        yield f"\n[{e}]\n".encode()
+
+
+async def format_ndjson(subscription: LogSubscription, timestamps: bool = False) -> AsyncIterator[bytes]:
+    try:
+        async for event in log_lines(subscription, timestamps):
+            yield (json.dumps(event) + "\n").encode()
+    except LogStreamLagged as e:
+        yield (json.dumps({"error": str(e)}) + "\n").encode()
+
+
+async def format_sse(subscription: LogSubscription, timestamps: bool = False) -> AsyncIterator[bytes]:
+    try:
+        async for event in log_lines(subscription, timestamps):
+            yield f"event: {event['stream']}\ndata: {json.dumps(event)}\n\n".encode()
+        yield b"event: end\ndata: {}\n\n"
+    except LogStreamLagged as e:
+        yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n".encode()
+
+
+_hub: Optional[LogHub] = None
+
+
+def get_log_hub() -> LogHub:
+    """Returns the shared log hub, creating it on first use."""
+    global _hub
+    if _hub is None:
+        _hub = LogHub(get_docker())
+    return _hub
@@ -1,8 +1,44 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+import anyio.to_thread
+from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+from app.auth import password_hasher, get_current_user
+from app.config import METRICS_ENABLED, DOCKER_HOSTS
+from app.docker_client import init_docker, close_docker, get_docker
+from app.fleet import get_fleet, start_fleet, stop_fleet
+from app.container_index import start_container_index, stop_container_index
+from app.build_jobs import start_build_queue, stop_build_queue, get_build_queue
+from app.stats_collector import start_stats_collector, stop_stats_collector
+from app.log_streams import get_log_hub
+from app.metrics import registry, slow_requests, MetricsMiddleware, monitor_event_loop
 from app.routes import auth_routes, docker_routes
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Shared Docker access layer; the SDK client itself connects on first use.
+    # In fleet mode it is the primary host's, so the container index, builds
+    # and stats follow that host while per-container calls go to their owner.
+    fleet = start_fleet()
+    init_docker(fleet.primary.docker if fleet else None)
+    await start_container_index()
+    start_build_queue()
+    start_stats_collector()
+    loop_monitor = asyncio.create_task(monitor_event_loop()) if METRICS_ENABLED else None
+    yield
+    if loop_monitor is not None:
+        loop_monitor.cancel()
+    await stop_stats_collector()
+    await stop_build_queue()
+    await stop_container_index()
+    close_docker()
+    await stop_fleet()
+    password_hasher.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # CORS Middleware - Allow all origins (you can adjust this as needed)
 app.add_middleware(
@@ -13,10 +49,36 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Performance instrumentation; added last so it also times the CORS middleware
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 # Include the routes
 app.include_router(auth_routes.router)
 app.include_router(docker_routes.router)
 
+# Queue depths are read when /metrics is scraped
+registry.gauge("docker_calls_in_flight", "Docker calls holding an access layer slot.", callback=lambda: get_docker().in_flight)
+registry.gauge("docker_calls_queued", "Docker calls waiting for an access layer slot.", callback=lambda: get_docker().queue_depth)
+registry.gauge("docker_calls_abandoned", "Docker calls still running after their caller timed out.", callback=lambda: get_docker().abandoned)
+registry.gauge("build_jobs_queued", "Build jobs waiting for a worker.", callback=lambda: get_build_queue().queue_depth)
+registry.gauge("auth_hash_pending", "Password hashing calls admitted to the process pool.", callback=lambda: password_hasher.pending)
+registry.gauge("log_shared_streams", "Shared following log streams open to the daemon.", callback=lambda: get_log_hub().shared_streams)
+if DOCKER_HOSTS.strip():  # Fleet mode only
+    registry.gauge("fleet_hosts_healthy", "Fleet hosts passing health checks.", callback=lambda: len(get_fleet().healthy_hosts()))
+registry.gauge("threadpool_tasks_waiting", "Sync work waiting for the server's shared thread pool.",
+               callback=lambda: anyio.to_thread.current_default_thread_limiter().statistics().tasks_waiting)
+
+# Prometheus scrape endpoint
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(registry.exposition(), media_type="text/plain; version=0.0.4")
+
+# Slowest recent requests with their Docker call breakdown
+@app.get("/metrics/slow")
+async def slow_request_samples(user: dict = Depends(get_current_user)):  # Require authentication
+    return {"threshold_seconds": slow_requests.threshold, "samples": slow_requests.samples()}
+
 
 
 
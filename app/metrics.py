@@ -0,0 +1,240 @@
+import asyncio
+import bisect
+import contextvars
+import heapq
+import itertools
+import logging
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.config import METRICS_SLOW_SAMPLES, METRICS_SLOW_THRESHOLD, METRICS_LOOP_LAG_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels, in Prometheus terms.
+
+    Observing is one bisect and two additions, cheap enough for every request.
+    """
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[tuple, list] = {}  # labels -> [per-bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, *labels: str):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            cumulative += series[len(self.buckets)]
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(series[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """Gauge with labels. With ``callback`` set, its single value is read at scrape time instead."""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), callback: Optional[Callable[[], float]] = None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self._values: Dict[tuple, float] = {}
+
+    def set(self, value: float, *labels: str):
+        self._values[labels] = value
+
+    def inc(self, *labels: str, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels: str, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        if self.callback is not None:
+            try:
+                value = self.callback()
+            except Exception:
+                # One broken callback must not fail the whole scrape, but it must not go unnoticed either
+                logger.exception("Gauge %s callback failed", self.name)
+                return lines
+            lines.append(f"{self.name} {_number(value)}")
+            return lines
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        return self.register(Histogram(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs) -> Gauge:
+        return self.register(Gauge(*args, **kwargs))
+
+    def exposition(self) -> str:
+        """Renders every metric in the Prometheus text format."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUEST_LATENCY = registry.histogram("http_request_duration_seconds", "HTTP request latency by route.", ("method", "route", "status"))
+RESPONSE_SIZE = registry.histogram("http_response_size_bytes", "HTTP response body size by route.", ("method", "route"), SIZE_BUCKETS)
+REQUESTS_IN_FLIGHT = registry.gauge("http_requests_in_flight", "HTTP requests currently being served.")
+DOCKER_CALL_LATENCY = registry.histogram("docker_call_duration_seconds", "Docker daemon call latency by operation.", ("operation", "outcome"))
+DOCKER_CALL_WAIT = registry.histogram("docker_call_wait_seconds", "Time Docker calls waited for a free slot in the access layer.", ("operation",))
+EVENT_LOOP_LAG = registry.histogram("event_loop_lag_seconds", "How late the event loop ran a scheduled wake-up.", buckets=LAG_BUCKETS)
+
+
+# Per-request Docker call breakdown: operation -> [calls, seconds]
+_request_docker_calls: contextvars.ContextVar[Optional[Dict[str, list]]] = contextvars.ContextVar("request_docker_calls", default=None)
+
+
+def observe_docker_call(operation: str, outcome: str, duration: float, waited: float = 0.0):
+    """Records one daemon call, and attributes it to the current request if there is one."""
+    DOCKER_CALL_LATENCY.observe(duration, operation, outcome)
+    DOCKER_CALL_WAIT.observe(waited, operation)
+    calls = _request_docker_calls.get()
+    if calls is not None:
+        entry = calls.get(operation)
+        if entry is None:
+            calls[operation] = [1, duration]
+        else:
+            entry[0] += 1
+            entry[1] += duration
+
+
+class SlowRequestSampler:
+    """Keeps the ``size`` slowest requests above ``threshold`` seconds, with their daemon-call breakdown."""
+
+    def __init__(self, size: int = METRICS_SLOW_SAMPLES, threshold: float = METRICS_SLOW_THRESHOLD):
+        self.size = size
+        self.threshold = threshold
+        self._heap: List[Tuple[float, int, dict]] = []  # Min-heap, so the fastest kept sample is evicted first
+        self._seq = itertools.count()
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    def offer(self, duration: float, sample: Callable[[], dict]):
+        if duration < self.threshold:
+            return
+        if len(self._heap) < self.size:
+            heapq.heappush(self._heap, (duration, next(self._seq), sample()))
+        elif duration > self._heap[0][0]:
+            heapq.heapreplace(self._heap, (duration, next(self._seq), sample()))
+
+    def samples(self) -> List[dict]:
+        return [sample for _, _, sample in sorted(self._heap, key=lambda item: -item[0])]
+
+
+slow_requests = SlowRequestSampler()
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, size and in-flight count per route template.
+
+    Routes are labelled by their template (e.g. /docker/stats/{container_id})
+    so label cardinality stays bounded; unknown paths share one label.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        started_at = time.time()
+        response = {"status": 500, "size": 0}
+        calls: Optional[Dict[str, list]] = {} if slow_requests.enabled else None
+        token = _request_docker_calls.set(calls)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                response["size"] += len(message.get("body", b""))
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            _request_docker_calls.reset(token)
+            duration = time.perf_counter() - started
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            REQUEST_LATENCY.observe(duration, method, template, str(response["status"]))
+            RESPONSE_SIZE.observe(response["size"], method, template)
+            slow_requests.offer(duration, lambda: {
+                "method": method,
+                "path": scope["path"],
+                "route": template,
+                "status": response["status"],
+                "duration": round(duration, 6),
+                "started_at": started_at,
+                "docker_calls": {op: {"calls": n, "seconds": round(s, 6)} for op, (n, s) in (calls or {}).items()},
+            })
+
+
+async def monitor_event_loop(interval: float = METRICS_LOOP_LAG_INTERVAL):
+    """Measures how late the loop wakes up from a sleep; sustained lag means something is blocking it."""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(loop.time() - started - interval, 0.0))
@@ -0,0 +1,14 @@
+from typing import List, Literal, Optional
+from pydantic import BaseModel, Field
+from app.config import BULK_DEFAULT_PARALLELISM, BULK_MAX_PARALLELISM
+
+class BulkOperation(BaseModel):
+    action: Literal["start", "stop", "restart", "remove", "stop_remove"]
+    ids: List[str] = []
+    names: List[str] = []
+    label: Optional[str] = None  # "key" or "key=value", matched against the container index
+    parallelism: int = Field(BULK_DEFAULT_PARALLELISM, ge=1, le=BULK_MAX_PARALLELISM)
+    timeout: Optional[float] = Field(None, gt=0)  # Per container, in seconds
+    stop_timeout: int = Field(10, ge=0)  # Grace period before the daemon kills a stopping container
+    force: bool = False  # Remove running containers without stopping them
+    allow_partial: bool = False  # Fleet mode: apply a label selector even if some hosts could not be listed
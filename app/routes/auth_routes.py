@@ -1,24 +1,26 @@
 from fastapi import APIRouter, HTTPException, Depends
 from fastapi.security import OAuth2PasswordRequestForm
-from app.auth import hash_password, verify_password, create_access_token, fake_users_db
+from app.auth import hash_password_async, verify_password_async, create_access_token, fake_users_db
 
 router = APIRouter()
 
 # Signup route (simplified)
 @router.post("/auth/signup/")
-def signup(username: str, password: str):
+async def signup(username: str, password: str):
     if username in fake_users_db:
         raise HTTPException(status_code=400, detail="Username already exists")
     
-    hashed_password = hash_password(password)
+    hashed_password = await hash_password_async(password)
+    if username in fake_users_db:  # Taken by a concurrent signup while hashing
+        raise HTTPException(status_code=400, detail="Username already exists")
     fake_users_db[username] = {"username": username, "password": hashed_password}
     return {"message": "User created successfully"}
 
 # Login route
 @router.post("/auth/login/")
-def login(form_data: OAuth2PasswordRequestForm = Depends()):
+async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     user = fake_users_db.get(form_data.username)
-    if not user or not verify_password(form_data.password, user["password"]):
+    if not user or not await verify_password_async(form_data.password, user["password"]):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     access_token = create_access_token(data={"sub": form_data.username})
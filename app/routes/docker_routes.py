@@ -1,32 +1,80 @@
-from fastapi import APIRouter, HTTPException, Form, Depends
-import docker
+from fastapi import APIRouter, HTTPException, Form, Depends, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from docker.errors import NotFound
+import hashlib
+import json
 import os
 from typing import Optional
 from app.auth import get_current_user
+from app.docker_client import get_docker, DockerTimeoutError
+from app.build_jobs import get_build_queue, format_progress
+from app.bulk_ops import resolve_targets, bulk_results
+from app.config import BULK_MAX_TARGETS
+from app.models.bulk import BulkOperation
+from app.stats_collector import get_stats_collector, METRICS
+from app.container_index import get_container_index
+from app.docker_manager import get_running_containers
+from app.fleet import get_fleet, run_for_container, log_hub_for, HostUnavailableError
+from app.log_streams import format_text, format_ndjson, format_sse, log_lines, LogStreamLagged
 
 router = APIRouter()
 
-# Docker client initialization
-client = docker.from_env()
-
-# Endpoint to build the Docker image
-@router.post("/docker/build_image/")
+# Endpoint to build the Docker image; queues the build and returns its job right away
+@router.post("/docker/build_image/", status_code=202)
 async def build_image(
     image_name: str = Form(...),  # Image name from the form
-    dockerfile_path: str = Form(...),  # Dockerfile path from the form
+    dockerfile_path: str = Form(...),  # Dockerfile (or build context directory) path from the form
     user: dict = Depends(get_current_user)  # Require authentication
 ):
+    if not os.path.exists(dockerfile_path):
+        raise HTTPException(status_code=400, detail="Dockerfile path does not exist.")
     try:
-        if not os.path.exists(dockerfile_path):
-            raise HTTPException(status_code=400, detail="Dockerfile path does not exist.")
-        
-        context_path = os.path.dirname(dockerfile_path)
-        image, logs = client.images.build(path=os.path.abspath(dockerfile_path), tag=image_name)
-
-        return {"message": f"Image {image_name} built successfully.", "logs": [log.get('stream') for log in logs if log.get('stream')]}
+        dockerfile_path = os.path.abspath(dockerfile_path)
+        if os.path.isdir(dockerfile_path):
+            context_path, dockerfile = dockerfile_path, "Dockerfile"
+        else:
+            context_path, dockerfile = os.path.split(dockerfile_path)
+        job = await get_build_queue().submit(context_path, image_name, dockerfile)
+        return {"message": f"Build of image {image_name} queued.", **job.to_dict()}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error building image: {str(e)}")
 
+# Endpoint to list recent build jobs
+@router.get("/docker/builds/")
+async def list_builds(user: dict = Depends(get_current_user)):  # Require authentication
+    return {"builds": [job.to_dict() for job in get_build_queue().list()]}
+
+# Endpoint to check the status of a build job
+@router.get("/docker/builds/{job_id}")
+async def build_status(job_id: str, user: dict = Depends(get_current_user)):  # Require authentication
+    job = get_build_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Build job {job_id} not found.")
+    return job.to_dict()
+
+# Endpoint to stream the progress of a build job as NDJSON or Server-Sent Events
+@router.get("/docker/builds/{job_id}/progress")
+async def build_progress(
+    job_id: str,
+    format: str = Query("ndjson", pattern="^(ndjson|sse)$"),
+    user: dict = Depends(get_current_user)  # Require authentication
+):
+    job = get_build_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Build job {job_id} not found.")
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(format_progress(job, format), media_type=media_type, headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# Endpoint to cancel a build job
+@router.post("/docker/builds/{job_id}/cancel")
+async def cancel_build(job_id: str, user: dict = Depends(get_current_user)):  # Require authentication
+    job = get_build_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Build job {job_id} not found.")
+    if not job.cancel():
+        raise HTTPException(status_code=409, detail=f"Build job {job_id} already {job.status}.")
+    return {"message": f"Build job {job_id} cancelled.", **job.to_dict()}
+
 # Endpoint to run a Docker container
 @router.post("/docker/run_container/")
 async def run_container(
@@ -39,41 +87,199 @@ async def run_container(
     try:
         port_mappings = {int(hp): int(cp) for p in ports.split(",") if ":" in p for hp, cp in [p.split(":")]}
         env_variables = {k: v for e in env_vars.split(",") if "=" in e for k, v in [e.split("=")]} 
-        container = client.containers.run(
-            image_name,
-            detach=detached,
-            ports=port_mappings or None,
-            environment=env_variables or None
+        fleet = get_fleet()
+        if fleet is not None:  # Placed on a host by the fleet's placement strategy
+            host, container = await fleet.run_container(
+                image_name,
+                detach=detached,
+                ports=port_mappings or None,
+                environment=env_variables or None
+            )
+            return {"message": "Container started successfully", "container_id": container.id, "host": host.name}
+        container = await get_docker().run(
+            lambda client: client.containers.run(
+                image_name,
+                detach=detached,
+                ports=port_mappings or None,
+                environment=env_variables or None
+            ),
+            op="containers.run",
         )
         return {"message": "Container started successfully", "container_id": container.id}
+    except DockerTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except HostUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error running container: {str(e)}")
 
-# Endpoint to check running containers
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether the request's If-None-Match names ``etag`` (or is *)."""
+    if_none_match = request.headers.get("if-none-match")
+    return bool(if_none_match) and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")])
+
+# Endpoint to check running containers (served from the event-driven container index)
 @router.get("/docker/containers_status/")
-async def containers_status(user: dict = Depends(get_current_user)):  # Require authentication
+async def containers_status(
+    request: Request,
+    response: Response,
+    status: Optional[str] = None,  # e.g. running, exited
+    label: Optional[str] = None,  # "key" or "key=value"
+    image: Optional[str] = None,  # Image tag, with or without the version
+    name_prefix: Optional[str] = None,
+    cursor: Optional[str] = None,  # next_cursor from the previous page
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    since_version: Optional[str] = None,  # Only return changes after this index version (the "version" of an earlier response)
+    user: dict = Depends(get_current_user)  # Require authentication
+):
+    fleet = get_fleet()
+    if fleet is not None:
+        # Gathered from every host at once. Versions belong to the single-daemon index, so
+        # there are no deltas; the ETag is a hash of the merged answer instead
+        if since_version is not None:
+            raise HTTPException(status_code=400, detail="since_version is not supported in fleet mode; poll with If-None-Match instead.")
+        containers, next_cursor, errors = await fleet.query_containers(status, label, image, name_prefix, cursor, limit)
+        if errors and len(errors) == len(fleet.hosts):
+            raise HTTPException(status_code=503, detail=f"Error fetching container status: no Docker host answered ({'; '.join(f'{name}: {e}' for name, e in errors.items())})")
+        body = {
+            "containers": containers,
+            "next_cursor": next_cursor,
+            "partial": bool(errors),
+            "errors": {name: str(e) for name, e in errors.items()},
+        }
+        etag = '"' + hashlib.sha256(json.dumps(body, sort_keys=True).encode()).hexdigest()[:32] + '"'
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        response.headers["ETag"] = etag
+        return body
+
+    index = get_container_index()
     try:
-        containers = client.containers.list(all=True)
-        return {"containers": [{"container_id": c.id, "container_name": c.name, "image_name": c.image.tags or "No image"} for c in containers]}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching container status: {str(e)}")
+        await index.wait_ready()
+    except DockerTimeoutError as e:
+        raise HTTPException(status_code=503, detail=f"Error fetching container status: {str(e)}")
+
+    etag = index.etag
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+
+    filters = {"status": status, "label": label, "image": image, "name_prefix": name_prefix}
+    if since_version is not None:
+        delta = index.changes_since(since_version, **filters)
+        if delta is not None:
+            changes, removed = delta
+            return {"version": index.version_token, "changes": changes, "removed": removed}
+
+    # Full listing, also the fallback when since_version is too old for the changelog or from before a restart
+    containers, next_cursor = index.query(cursor=cursor, limit=limit, **filters)
+    return {"version": index.version_token, "containers": containers, "next_cursor": next_cursor}
 
 # Endpoint to fetch logs of a container
 @router.get("/docker/container_logs/{container_id}")
 async def container_logs(container_id: str, user: dict = Depends(get_current_user)):  # Require authentication
     try:
-        container = client.containers.get(container_id)
-        return {"logs": container.logs(tail=100).decode('utf-8')}
+        logs = await run_for_container(
+            container_id,
+            lambda client: client.containers.get(container_id).logs(tail=100),
+            op="containers.logs",
+        )
+        return {"logs": logs.decode('utf-8')}
+    except DockerTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching container logs: {str(e)}")
 
+LOG_MEDIA_TYPES = {"text": "text/plain; charset=utf-8", "ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+TAIL_PATTERN = r"^(all|\d+)$"  # A line count from the end of the log, or "all" like the Docker API
+
+def tail_lines(tail: str) -> Optional[int]:
+    """Turns the tail query parameter into a line count; None means the whole log."""
+    return None if tail == "all" else int(tail)
+
+# Endpoint to stream logs of a container as plain text, NDJSON or Server-Sent Events
+@router.get("/docker/container_logs/{container_id}/stream")
+async def stream_container_logs(
+    container_id: str,
+    format: str = Query("text", pattern="^(text|ndjson|sse)$"),
+    follow: bool = False,
+    tail: str = Query("100", pattern=TAIL_PATTERN),  # Lines from the end of the log, or "all"
+    since: Optional[float] = None,  # Unix timestamp
+    until: Optional[float] = None,  # Unix timestamp
+    timestamps: bool = False,
+    stdout: bool = True,
+    stderr: bool = True,
+    user: dict = Depends(get_current_user)  # Require authentication
+):
+    try:
+        hub = await log_hub_for(container_id)
+        subscription = await hub.open(
+            container_id, follow=follow, tail=tail_lines(tail), since=since, until=until,
+            timestamps=timestamps, stdout=stdout, stderr=stderr,
+        )
+    except DockerTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching container logs: {str(e)}")
+
+    if format == "ndjson":
+        body = format_ndjson(subscription, timestamps)
+    elif format == "sse":
+        body = format_sse(subscription, timestamps)
+    else:
+        body = format_text(subscription)
+    return StreamingResponse(body, media_type=LOG_MEDIA_TYPES[format], headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# WebSocket endpoint to follow logs of a container; authenticates with the token query parameter
+@router.websocket("/docker/container_logs/{container_id}/ws")
+async def follow_container_logs(
+    websocket: WebSocket,
+    container_id: str,
+    token: str,
+    tail: str = Query("100", pattern=TAIL_PATTERN),  # Lines from the end of the log, or "all"
+    since: Optional[float] = None,
+    timestamps: bool = False,
+    stdout: bool = True,
+    stderr: bool = True,
+):
+    try:
+        await get_current_user(token)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+
+    await websocket.accept()
+    try:
+        hub = await log_hub_for(container_id)
+        subscription = await hub.open(
+            container_id, follow=True, tail=tail_lines(tail), since=since,
+            timestamps=timestamps, stdout=stdout, stderr=stderr,
+        )
+    except Exception as e:
+        await websocket.send_json({"error": f"Error fetching container logs: {str(e)}"})
+        await websocket.close(code=1011)
+        return
+
+    try:
+        async for event in log_lines(subscription, timestamps):
+            await websocket.send_json(event)
+        await websocket.close()
+    except LogStreamLagged as e:
+        await websocket.send_json({"error": str(e)})
+        await websocket.close(code=1013)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        subscription.close()
+
 # Endpoint to stop a running container
 @router.post("/docker/stop_container/{container_id}")
 async def stop_container(container_id: str, user: dict = Depends(get_current_user)):  # Require authentication
     try:
-        container = client.containers.get(container_id)
-        container.stop()
+        await run_for_container(container_id, lambda client: client.containers.get(container_id).stop(), op="containers.stop")
         return {"message": f"Container {container_id} stopped."}
+    except DockerTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error stopping container: {str(e)}")
 
@@ -81,21 +287,105 @@ async def stop_container(container_id: str, user: dict = Depends(get_current_use
 @router.post("/docker/remove_container/{container_id}")
 async def remove_container(container_id: str, user: dict = Depends(get_current_user)):  # Require authentication
     try:
-        container = client.containers.get(container_id)
-        container.remove()
+        await run_for_container(container_id, lambda client: client.containers.get(container_id).remove(), op="containers.remove")
         return {"message": f"Container {container_id} removed."}
+    except DockerTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error removing container: {str(e)}")
 
+# Endpoint to start, stop, restart or remove many containers at once; streams one NDJSON result per container
+@router.post("/docker/containers/bulk")
+async def bulk_containers(operation: BulkOperation, user: dict = Depends(get_current_user)):  # Require authentication
+    try:
+        targets, host_errors = await resolve_targets(operation)
+    except (DockerTimeoutError, HostUnavailableError) as e:
+        raise HTTPException(status_code=503, detail=f"Error resolving containers: {str(e)}")
+    if not targets:
+        raise HTTPException(status_code=400, detail="No containers matched the given ids, names or label.")
+    if len(targets) > BULK_MAX_TARGETS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_MAX_TARGETS} containers per request.")
+
+    async def body():
+        async for result in bulk_results(operation, targets, host_errors):
+            yield (json.dumps(result) + "\n").encode()
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+# Endpoint to rank containers by their latest resource usage, with totals across all containers
+@router.get("/docker/stats/top")
+async def top_stats(
+    metric: str = Query("cpu_percent", pattern="^(" + "|".join(METRICS) + ")$"),
+    n: int = Query(10, ge=1, le=1000),
+    user: dict = Depends(get_current_user)  # Require authentication
+):
+    top = get_stats_collector().top(metric, n)
+    fleet = get_fleet()
+    if fleet is not None:  # Stats are only collected on the primary host
+        top["hosts"] = [fleet.primary.name]
+        top["partial"] = len(fleet.hosts) > 1
+    return top
+
+# Endpoint to fetch the resource usage history of a container
+@router.get("/docker/stats/{container_id}")
+async def container_stats(
+    container_id: str,
+    resolution: Optional[str] = None,  # One of the configured tiers, e.g. 10s, 1m, 5m; finest by default
+    since: Optional[float] = None,  # Unix timestamp
+    user: dict = Depends(get_current_user)  # Require authentication
+):
+    collector = get_stats_collector()
+    resolutions = collector.resolutions()
+    resolution = resolution or resolutions[0]
+    if resolution not in resolutions:
+        raise HTTPException(status_code=400, detail=f"Resolution must be one of {', '.join(resolutions)}.")
+    fleet = get_fleet()
+    if fleet is not None:  # Stats are only collected on the primary host
+        try:
+            host = await fleet.locate(container_id)
+        except NotFound:
+            raise HTTPException(status_code=404, detail=f"Container {container_id} not found.")
+        except HostUnavailableError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        if host is not fleet.primary:
+            raise HTTPException(
+                status_code=501,
+                detail=f"Stats are only collected on the primary Docker host {fleet.primary.name}; container {container_id} runs on {host.name}.",
+            )
+    series = collector.series(container_id, resolution, since)
+    if series is None:
+        raise HTTPException(status_code=404, detail=f"No stats for container {container_id}; it may not be running.")
+    if fleet is not None:
+        series["host"] = fleet.primary.name
+    return series
+
 # Endpoint to create a Docker volume
 @router.post("/docker/create_volume/")
 async def create_volume(volume_name: str = Form(...), user: dict = Depends(get_current_user)):  # Require authentication
     try:
-        volume = client.volumes.create(name=volume_name)
+        fleet = get_fleet()
+        if fleet is not None:  # On every host, since containers may be placed on any of them
+            created, errors = await fleet.scatter(lambda client: client.volumes.create(name=volume_name), op="volumes.create")
+            if not created:
+                raise HTTPException(status_code=500, detail=f"Error creating volume: {'; '.join(f'{name}: {e}' for name, e in errors.items())}")
+            return {"message": f"Volume {volume_name} created.", "hosts": list(created), "errors": {name: str(e) for name, e in errors.items()}}
+        await get_docker().run(lambda client: client.volumes.create(name=volume_name), op="volumes.create")
         return {"message": f"Volume {volume_name} created."}
+    except HTTPException:
+        raise
+    except DockerTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating volume: {str(e)}")
 
+# Endpoint to check the health and load of each Docker host in fleet mode
+@router.get("/docker/fleet/hosts")
+async def fleet_hosts(user: dict = Depends(get_current_user)):  # Require authentication
+    fleet = get_fleet()
+    if fleet is None:
+        return {"fleet": False, "hosts": []}
+    return {"fleet": True, "placement": fleet.placement, "hosts": fleet.status()}
+
 
 
 
@@ -105,7 +395,7 @@ async def create_volume(volume_name: str = Form(...), user: dict = Depends(get_c
 
 
 @router.get("/containers_status/")
-def get_containers_status(current_user: dict = Depends(get_current_user)):  # Enforce auth
+async def get_containers_status(current_user: dict = Depends(get_current_user)):  # Enforce auth
     # Now only authenticated users can access this!
-    containers = get_all_containers()  # Fetch container info
+    containers = await get_running_containers()  # Fetch container info
     return {"containers": containers}
@@ -0,0 +1,342 @@
+import asyncio
+import heapq
+import logging
+import time
+from array import array
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.config import STATS_INTERVAL, STATS_CONNECTIONS, STATS_TIERS, STATS_MAX_CONTAINERS
+from app.container_index import ContainerIndex, get_container_index
+from app.docker_client import AsyncDocker, get_docker
+
+logger = logging.getLogger(__name__)
+
+METRICS = (
+    "cpu_percent",
+    "memory_usage",
+    "memory_percent",
+    "net_rx_rate",
+    "net_tx_rate",
+    "blk_read_rate",
+    "blk_write_rate",
+)
+
+
+def parse_tiers(spec: str) -> List[Tuple[int, int]]:
+    """Parses "step:points,..." into [(step_seconds, points), ...]."""
+    tiers = []
+    for part in spec.split(","):
+        step, points = part.split(":")
+        tiers.append((int(step), int(points)))
+    return sorted(tiers)
+
+
+def resolution_label(step: int) -> str:
+    return f"{step // 60}m" if step % 60 == 0 else f"{step}s"
+
+
+class RingBuffer:
+    """Fixed-capacity circular buffer over a preallocated typed array."""
+
+    def __init__(self, capacity: int, typecode: str = "f"):
+        self._data = array(typecode, bytes(array(typecode).itemsize * capacity))
+        self._capacity = capacity
+        self._start = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, value: float):
+        end = (self._start + self._size) % self._capacity
+        self._data[end] = value
+        if self._size < self._capacity:
+            self._size += 1
+        else:
+            self._start = (self._start + 1) % self._capacity
+
+    def values(self) -> List[float]:
+        """Returns the contents, oldest first."""
+        end = self._start + self._size
+        if end <= self._capacity:
+            return self._data[self._start:end].tolist()
+        return self._data[self._start:].tolist() + self._data[:end - self._capacity].tolist()
+
+
+class SeriesTier:
+    """One resolution of a container's series: samples averaged into fixed-width time buckets."""
+
+    def __init__(self, step: int, points: int):
+        self.step = step
+        self._timestamps = RingBuffer(points, "d")
+        self._columns = [RingBuffer(points, "f") for _ in METRICS]
+        self._bucket: Optional[float] = None
+        self._sums = [0.0] * len(METRICS)
+        self._count = 0
+
+    def add(self, timestamp: float, values: List[float]):
+        bucket = timestamp - timestamp % self.step
+        if self._bucket is not None and bucket != self._bucket:
+            self._flush()
+        self._bucket = bucket
+        for i, value in enumerate(values):
+            self._sums[i] += value
+        self._count += 1
+
+    def _flush(self):
+        if not self._count:
+            return
+        self._timestamps.append(self._bucket)
+        for column, total in zip(self._columns, self._sums):
+            column.append(total / self._count)
+        self._sums = [0.0] * len(METRICS)
+        self._count = 0
+
+    def points(self, since: Optional[float] = None) -> List[dict]:
+        columns = [column.values() for column in self._columns]
+        points = []
+        for i, timestamp in enumerate(self._timestamps.values()):
+            if since is not None and timestamp < since:
+                continue
+            point = {"timestamp": timestamp}
+            point.update((metric, round(values[i], 3)) for metric, values in zip(METRICS, columns))
+            points.append(point)
+        return points
+
+
+class ContainerSeries:
+    """All resolutions for one container, plus the raw counters needed for the next delta."""
+
+    def __init__(self, tiers: List[Tuple[int, int]]):
+        self.tiers = [SeriesTier(step, points) for step, points in tiers]
+        self.latest: Optional[Dict[str, float]] = None
+        self.latest_at: Optional[float] = None
+        self._previous: Optional[Tuple[float, Tuple[float, ...]]] = None
+
+    def add_sample(self, timestamp: float, raw: dict):
+        current = counters(raw)
+        previous, self._previous = self._previous, (timestamp, current)
+        if previous is None:
+            return  # Rates need two samples
+        values = compute_metrics(previous[1], current, raw, timestamp - previous[0])
+        self.latest = dict(zip(METRICS, values))
+        self.latest_at = timestamp
+        for tier in self.tiers:
+            tier.add(timestamp, values)
+
+
+def _network_totals(raw: dict) -> Tuple[int, int]:
+    networks = raw.get("networks") or {}
+    return (
+        sum(n.get("rx_bytes", 0) for n in networks.values()),
+        sum(n.get("tx_bytes", 0) for n in networks.values()),
+    )
+
+
+def _block_totals(raw: dict) -> Tuple[int, int]:
+    read = write = 0
+    for entry in (raw.get("blkio_stats") or {}).get("io_service_bytes_recursive") or []:
+        op = entry.get("op", "").lower()
+        if op == "read":
+            read += entry.get("value", 0)
+        elif op == "write":
+            write += entry.get("value", 0)
+    return read, write
+
+
+def _memory(raw: dict) -> Tuple[float, float]:
+    memory = raw.get("memory_stats") or {}
+    details = memory.get("stats") or {}
+    # Page cache is reclaimable; subtract it like `docker stats` does (cgroup v2 / v1 names)
+    cache = details.get("inactive_file", details.get("total_inactive_file", details.get("cache", 0)))
+    usage = max(memory.get("usage", 0) - cache, 0)
+    limit = memory.get("limit", 0)
+    return usage, (usage / limit * 100 if limit else 0.0)
+
+
+def counters(raw: dict) -> Tuple[float, ...]:
+    """Extracts the cumulative counters rates are computed from; only these are kept between samples."""
+    cpu = raw.get("cpu_stats") or {}
+    return (
+        cpu.get("cpu_usage", {}).get("total_usage", 0),
+        cpu.get("system_cpu_usage", 0),
+        *_network_totals(raw),
+        *_block_totals(raw),
+    )
+
+
+def compute_metrics(previous: Tuple[float, ...], current: Tuple[float, ...], raw: dict, elapsed: float) -> List[float]:
+    """Derives METRICS from the counters of two samples taken ``elapsed`` seconds apart and the newer raw sample."""
+    cpu_delta = current[0] - previous[0]
+    system_delta = current[1] - previous[1]
+    cpu = raw.get("cpu_stats") or {}
+    online_cpus = cpu.get("online_cpus") or len(cpu.get("cpu_usage", {}).get("percpu_usage") or []) or 1
+    cpu_percent = cpu_delta / system_delta * online_cpus * 100 if system_delta > 0 and cpu_delta > 0 else 0.0
+
+    memory_usage, memory_percent = _memory(raw)
+
+    # Counters reset when a container restarts; treat that interval as zero
+    rates = [max(now - before, 0) / elapsed if elapsed > 0 else 0.0 for now, before in zip(current[2:], previous[2:])]
+    return [cpu_percent, memory_usage, memory_percent, *rates]
+
+
+class StatsCollector:
+    """Samples resource usage of every running container into in-memory ring buffers.
+
+    Keeping a streaming stats request open per container would hold one
+    daemon connection per container. Instead a fixed number of workers take
+    turns issuing one-shot stats requests, so the connection count stays at
+    ``connections`` however many containers run; rates are derived from
+    consecutive samples. The workers have their own access layer to the
+    daemon, so sampling never takes slots from API requests. The set of
+    running containers comes from the container index, so no listing is
+    needed. Every series is preallocated, which keeps memory at a fixed cost
+    per tracked container.
+    """
+
+    def __init__(
+        self,
+        docker_layer: AsyncDocker,
+        index: ContainerIndex,
+        interval: float = STATS_INTERVAL,
+        connections: int = STATS_CONNECTIONS,
+        tiers: str = STATS_TIERS,
+        max_containers: int = STATS_MAX_CONTAINERS,
+    ):
+        self._docker = docker_layer.spawn(connections)
+        self._index = index
+        self.interval = interval
+        self.connections = connections
+        self.tiers = parse_tiers(tiers)
+        self.max_containers = max_containers
+        self._series: Dict[str, ContainerSeries] = {}
+        self._names: Dict[str, str] = {}
+        self._due: asyncio.Queue = asyncio.Queue()
+        self._queued: Set[str] = set()
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._schedule())]
+            self._tasks += [asyncio.create_task(self._worker()) for _ in range(self.connections)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._docker.close()
+
+    # Queries
+
+    def resolutions(self) -> List[str]:
+        return [resolution_label(step) for step, _ in self.tiers]
+
+    def series(self, container_id: str, resolution: str, since: Optional[float] = None) -> Optional[dict]:
+        """Returns one container's series at a resolution, or None if it is not tracked."""
+        series = self._series.get(container_id)
+        if series is None:
+            # Allow a unique ID prefix, like the Docker CLI
+            matches = [cid for cid in self._series if cid.startswith(container_id)]
+            if len(matches) != 1:
+                return None
+            container_id, series = matches[0], self._series[matches[0]]
+        tier = next(tier for tier in series.tiers if resolution_label(tier.step) == resolution)
+        return {
+            "container_id": container_id,
+            "container_name": self._names.get(container_id),
+            "resolution": resolution,
+            "latest": series.latest,
+            "latest_at": series.latest_at,
+            "points": tier.points(since),
+        }
+
+    def top(self, metric: str, n: int) -> dict:
+        """Returns the ``n`` containers with the highest latest ``metric``, and totals across all containers."""
+        latest = [(cid, series.latest) for cid, series in self._series.items() if series.latest is not None]
+        totals = {name: round(sum(values[name] for _, values in latest), 3) for name in METRICS if name != "memory_percent"}
+        top = heapq.nlargest(n, latest, key=lambda item: item[1][metric])
+        return {
+            "metric": metric,
+            "containers": len(latest),
+            "totals": totals,
+            "top": [
+                {"container_id": cid, "container_name": self._names.get(cid), **{k: round(v, 3) for k, v in values.items()}}
+                for cid, values in top
+            ],
+        }
+
+    # Collection
+
+    async def _schedule(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            try:
+                await self._index.wait_ready()
+                running, _ = self._index.query(status="running")
+                running = running[:self.max_containers]
+                current = {c["container_id"] for c in running}
+                for container_id in list(self._series):
+                    if container_id not in current:
+                        del self._series[container_id]
+                        self._names.pop(container_id, None)
+                for container in running:
+                    container_id = container["container_id"]
+                    self._names[container_id] = container["container_name"]
+                    if container_id not in self._series:
+                        self._series[container_id] = ContainerSeries(self.tiers)
+                    if container_id not in self._queued:  # Still pending from a slow round
+                        self._queued.add(container_id)
+                        self._due.put_nowait(container_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Stats scheduling failed: %s", e)
+            await asyncio.sleep(max(0.0, self.interval - (loop.time() - started)))
+
+    async def _worker(self):
+        while True:
+            container_id = await self._due.get()
+            self._queued.discard(container_id)
+            if container_id not in self._series:
+                continue
+            try:
+                raw = await self._docker.run(
+                    lambda client: client.api.stats(container_id, stream=False, one_shot=True),
+                    op="containers.stats",
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.debug("Stats sample for %s failed: %s", container_id[:12], e)
+                continue
+            series = self._series.get(container_id)
+            if series is not None:
+                series.add_sample(time.time(), raw)
+
+
+_collector: Optional[StatsCollector] = None
+
+
+def get_stats_collector() -> StatsCollector:
+    """Returns the shared stats collector, creating it on first use."""
+    global _collector
+    if _collector is None:
+        _collector = StatsCollector(get_docker(), get_container_index())
+    return _collector
+
+
+def start_stats_collector() -> StatsCollector:
+    """Starts sampling. Called at application startup."""
+    collector = get_stats_collector()
+    collector.start()
+    return collector
+
+
+async def stop_stats_collector():
+    """Stops sampling. Called at application shutdown."""
+    global _collector
+    if _collector is not None:
+        await _collector.stop()
+        _collector = None
@@ -0,0 +1,720 @@
+"""Fake Docker Engine API server for load tests and benchmarks.
+
+Serves the part of the Engine API this app uses from in-memory state, on a
+Unix socket, so ``docker.from_env()`` talks to it when started with
+``DOCKER_HOST=unix:///path/to/socket``. Per-request latency, container and
+image counts, log volume and the rate of background container events are
+configurable, and state is generated from a seed so runs are reproducible.
+
+Every request is counted by endpoint (e.g. ``GET /containers/{id}/json``),
+which is how the benchmark tells how many daemon requests each API call
+costs. ``GET /_fake/requests`` returns the counts; they are not themselves
+counted.
+
+    python -m bench.fake_engine /tmp/docker.sock --containers 500 --latency-ms 2
+"""
+import argparse
+import hashlib
+import json
+import os
+import queue
+import random
+import re
+import socketserver
+import threading
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass
+from http.server import BaseHTTPRequestHandler
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+API_VERSION = "1.45"
+
+
+@dataclass
+class FakeEngineConfig:
+    containers: int = 200  # Created at startup; about three in four are running
+    images: int = 10
+    latency_ms: float = 1.0  # Added to every request before it is served
+    jitter_ms: float = 0.5  # Uniform random extra latency, 0..jitter_ms
+    log_lines: int = 1000  # History lines per container
+    log_line_bytes: int = 120
+    log_rate: float = 10.0  # Lines per second per followed container
+    event_rate: float = 0.0  # Background container state changes per second
+    build_steps: int = 5
+    seed: int = 42
+
+
+def _digest(*parts) -> str:
+    return hashlib.sha256(":".join(map(str, parts)).encode()).hexdigest()
+
+
+class EngineState:
+    """Containers, images and volumes, plus the event subscribers. All access holds ``lock``."""
+
+    def __init__(self, config: FakeEngineConfig):
+        self.config = config
+        self.lock = threading.Lock()
+        self.rng = random.Random(config.seed)
+        self.started_at = time.time()
+        self.images: Dict[str, dict] = {}
+        self.containers: Dict[str, dict] = {}
+        self.volumes: Dict[str, dict] = {}
+        self.subscribers: List[queue.Queue] = []
+        self._serial = 0
+        for i in range(config.images):
+            self.add_image(f"bench/app{i}:latest")
+        image_ids = list(self.images)
+        for i in range(config.containers):
+            state = "running" if self.rng.random() < 0.75 else "exited"
+            self.add_container(f"bench-{i}", image_ids[i % len(image_ids)], {"bench": "1", "group": str(i % 10)}, state)
+
+    def add_image(self, tag: str) -> str:
+        image_id = "sha256:" + _digest("image", tag)
+        image = self.images.setdefault(image_id, {"Id": image_id, "RepoTags": [], "Created": int(self.started_at), "Size": 10_000_000, "Labels": {}})
+        for other in self.images.values():
+            if tag in other["RepoTags"] and other is not image:
+                other["RepoTags"].remove(tag)
+        if tag not in image["RepoTags"]:
+            image["RepoTags"].append(tag)
+        return image_id
+
+    def find_image(self, name: str) -> Optional[dict]:
+        if ":" not in name.split("/")[-1] and not name.startswith("sha256:"):
+            name += ":latest"
+        for image in self.images.values():
+            if image["Id"] == name or name in image["RepoTags"] or image["Id"].startswith("sha256:" + name):
+                return image
+        return None
+
+    def add_container(self, name: str, image_id: str, labels: dict, state: str = "created", tty: bool = False) -> dict:
+        self._serial += 1
+        container_id = _digest("container", self.config.seed, self._serial, name)
+        container = {
+            "Id": container_id,
+            "Name": name,
+            "ImageID": image_id,
+            "Image": (self.images[image_id]["RepoTags"] or [image_id])[0],
+            "Labels": labels,
+            "State": state,
+            "Created": time.time(),
+            "StartedAt": time.time() if state == "running" else None,
+            "Tty": tty,
+            "Restarts": 0,
+        }
+        self.containers[container_id] = container
+        return container
+
+    def find_container(self, ref: str) -> Optional[dict]:
+        container = self.containers.get(ref)
+        if container is not None:
+            return container
+        matches = [c for c in self.containers.values() if c["Name"] == ref.lstrip("/")]
+        if not matches and len(ref) >= 4:
+            matches = [c for cid, c in self.containers.items() if cid.startswith(ref)]
+        return matches[0] if len(matches) == 1 else None
+
+    def set_state(self, container: dict, state: str, action: str):
+        container["State"] = state
+        if state == "running":
+            container["StartedAt"] = time.time()
+        self.publish("container", action, container["Id"], {"name": container["Name"], "image": container["Image"]})
+
+    def publish(self, type_: str, action: str, actor_id: str, attributes: dict):
+        now = time.time()
+        event = {
+            "Type": type_,
+            "Action": action,
+            "Actor": {"ID": actor_id, "Attributes": attributes},
+            "scope": "local",
+            "time": int(now),
+            "timeNano": int(now * 1e9),
+        }
+        if type_ == "container":
+            event.update(status=action, id=actor_id, **({"from": attributes["image"]} if "image" in attributes else {}))
+        for subscriber in list(self.subscribers):
+            subscriber.put(event)
+
+
+# Summaries and inspect documents, in the Engine API's shapes
+
+def container_summary(container: dict) -> dict:
+    running = container["State"] == "running"
+    return {
+        "Id": container["Id"],
+        "Names": ["/" + container["Name"]],
+        "Image": container["Image"],
+        "ImageID": container["ImageID"],
+        "Command": "/bin/sh -c serve",
+        "Created": int(container["Created"]),
+        "State": container["State"],
+        "Status": "Up 5 minutes" if running else "Exited (0) 5 minutes ago",
+        "Ports": [],
+        "Labels": container["Labels"],
+        "HostConfig": {"NetworkMode": "default"},
+        "Mounts": [],
+    }
+
+
+def container_inspect(container: dict) -> dict:
+    return {
+        "Id": container["Id"],
+        "Name": "/" + container["Name"],
+        "Created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(container["Created"])),
+        "Image": container["ImageID"],
+        "RestartCount": container["Restarts"],
+        "State": {
+            "Status": container["State"],
+            "Running": container["State"] == "running",
+            "ExitCode": 0,
+            "StartedAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(container["StartedAt"] or 0)),
+        },
+        "Config": {"Image": container["Image"], "Labels": container["Labels"], "Tty": container["Tty"], "Env": [], "Cmd": ["serve"]},
+        "HostConfig": {"LogConfig": {"Type": "json-file", "Config": {}}, "NetworkMode": "default"},
+        "NetworkSettings": {"Ports": {}, "Networks": {}},
+        "Mounts": [],
+    }
+
+
+def container_stats(container: dict, now: float) -> dict:
+    """A one-shot stats sample whose counters grow steadily while the container runs."""
+    uptime = max(now - (container["StartedAt"] or now), 0.0) if container["State"] == "running" else 0.0
+    weight = int(container["Id"][:4], 16) / 0xFFFF + 0.1  # Stable per container, so rankings are too
+    limit = 2 * 1024 ** 3
+    return {
+        "read": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(now)),
+        "id": container["Id"],
+        "name": "/" + container["Name"],
+        "cpu_stats": {
+            "cpu_usage": {"total_usage": int(uptime * weight * 2e8)},
+            "system_cpu_usage": int((now - 1.6e9) * 4e9),
+            "online_cpus": 4,
+        },
+        "precpu_stats": {},
+        "memory_stats": {"usage": int(weight * 256 * 1024 ** 2), "limit": limit, "stats": {"inactive_file": 4 * 1024 ** 2}},
+        "networks": {"eth0": {"rx_bytes": int(uptime * weight * 20_000), "tx_bytes": int(uptime * weight * 5_000)}},
+        "blkio_stats": {"io_service_bytes_recursive": [
+            {"major": 8, "minor": 0, "op": "read", "value": int(uptime * weight * 1_000)},
+            {"major": 8, "minor": 0, "op": "write", "value": int(uptime * weight * 4_000)},
+        ]},
+    }
+
+
+def log_line(container: dict, n: int, timestamp: float, width: int, timestamps: bool) -> bytes:
+    text = f"{container['Name']} line {n} "
+    text += "x" * max(width - len(text) - 1, 0) + "\n"
+    if timestamps:
+        text = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(timestamp)) + f".{int(timestamp % 1 * 1e9):09d}Z " + text
+    return text.encode()
+
+
+def frame(stream: int, payload: bytes) -> bytes:
+    """Multiplexed log framing: stream type, three zero bytes, big-endian payload length."""
+    return bytes((stream, 0, 0, 0)) + len(payload).to_bytes(4, "big") + payload
+
+
+def matches_labels(labels: dict, selectors: List[str]) -> bool:
+    """Applies "key" / "key=value" label filters."""
+    for selector in selectors:
+        key, has_value, value = selector.partition("=")
+        if key not in labels or (has_value and labels[key] != value):
+            return False
+    return True
+
+
+class NotFound(Exception):
+    pass
+
+
+class Conflict(Exception):
+    pass
+
+
+ROUTES: List[Tuple[str, "re.Pattern", str, str]] = []  # (method, pattern, handler name, endpoint label)
+
+
+def route(method: str, template: str):
+    # Image names may contain slashes (registry/repository:tag); other parameters may not
+    pattern = re.compile("^" + re.sub(r"\{(\w+)\}", lambda m: f"(?P<{m[1]}>{'.+' if m[1] == 'name' else '[^/]+'})", template) + "$")
+
+    def register(fn):
+        ROUTES.append((method, pattern, fn.__name__, f"{method} {template}"))
+        return fn
+    return register
+
+
+class EngineHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real daemon
+    server: "FakeEngineServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    # Plumbing
+
+    def _dispatch(self, method: str):
+        parts = urlsplit(self.path)
+        path = re.sub(r"^/v\d+\.\d+", "", parts.path)
+        self.query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+        if path == "/_fake/requests" and method == "GET":
+            self._send_json(200, self.server.request_counts())
+            return
+        for route_method, pattern, name, label in ROUTES:
+            match = pattern.match(path) if route_method == method else None
+            if match:
+                self.server.count(label)
+                self.server.delay()
+                try:
+                    getattr(self, name)(**match.groupdict())
+                except NotFound as e:
+                    self._send_json(404, {"message": str(e)})
+                except Conflict as e:
+                    self._send_json(409, {"message": str(e)})
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True
+                return
+        self.server.count(f"{method} (unknown)")
+        self._read_body()
+        self._send_json(404, {"message": f"page not found: {method} {path}"})
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def do_HEAD(self):
+        self._dispatch("HEAD")
+
+    def _read_body(self) -> bytes:
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    while self.rfile.readline() not in (b"\r\n", b"\n", b""):
+                        pass  # Trailers
+                    return b"".join(chunks)
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _json_body(self) -> dict:
+        body = self._read_body()
+        return json.loads(body) if body else {}
+
+    def _send(self, code: int, body: bytes = b"", content_type: str = "application/json"):
+        self.send_response(code)
+        self.send_header("Api-Version", API_VERSION)
+        if code != 204 and code != 304:
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body and code not in (204, 304):
+            self.wfile.write(body)
+
+    def _send_json(self, code: int, payload):
+        self._send(code, json.dumps(payload).encode())
+
+    def _start_stream(self, content_type: str):
+        self.send_response(200)
+        self.send_header("Api-Version", API_VERSION)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _chunk(self, data: bytes):
+        if data:
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+    def _end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _flag(self, name: str, default: bool = False) -> bool:
+        value = self.query.get(name)
+        return default if value is None else value.lower() in ("1", "true")
+
+    def _container(self, ref: str) -> dict:
+        container = self.server.state.find_container(ref)
+        if container is None:
+            raise NotFound(f"No such container: {ref}")
+        return container
+
+    # System
+
+    @route("GET", "/_ping")
+    def ping(self):
+        self._send(200, b"OK", "text/plain")
+
+    @route("HEAD", "/_ping")
+    def ping_head(self):
+        self._send(200, b"", "text/plain")
+
+    @route("GET", "/version")
+    def version(self):
+        self._send_json(200, {"Version": "fake", "ApiVersion": API_VERSION, "MinAPIVersion": "1.24", "Os": "linux", "Arch": "amd64"})
+
+    @route("GET", "/info")
+    def info(self):
+        state = self.server.state
+        with state.lock:
+            running = sum(1 for c in state.containers.values() if c["State"] == "running")
+            self._send_json(200, {"Containers": len(state.containers), "ContainersRunning": running, "Images": len(state.images), "Name": "fake-engine"})
+
+    @route("GET", "/events")
+    def events(self):
+        subscriber: queue.Queue = queue.Queue()
+        state = self.server.state
+        with state.lock:
+            state.subscribers.append(subscriber)
+        try:
+            self._start_stream("application/json")
+            while not self.server.stopping.is_set():
+                try:
+                    event = subscriber.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                self._chunk(json.dumps(event).encode() + b"\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with state.lock:
+                state.subscribers.remove(subscriber)
+            self.close_connection = True
+
+    # Containers
+
+    @route("GET", "/containers/json")
+    def list_containers(self):
+        filters = json.loads(self.query.get("filters") or "{}")
+        ids = filters.get("id")
+        labels = filters.get("label") or []
+        statuses = filters.get("status") or []
+        show_all = self._flag("all")
+        state = self.server.state
+        with state.lock:
+            candidates = [state.containers[cid] for cid in ids if cid in state.containers] if ids else list(state.containers.values())
+            summaries = []
+            for container in candidates:
+                if not show_all and not statuses and container["State"] != "running":
+                    continue
+                if statuses and container["State"] not in statuses:
+                    continue
+                if not matches_labels(container["Labels"], labels):
+                    continue
+                summaries.append(container_summary(container))
+        self._send_json(200, summaries)
+
+    @route("POST", "/containers/create")
+    def create_container(self):
+        body = self._json_body()
+        state = self.server.state
+        with state.lock:
+            image = state.find_image(body.get("Image", ""))
+            if image is None:
+                raise NotFound(f"No such image: {body.get('Image')}")
+            name = self.query.get("name") or f"fake-{state._serial + 1}"
+            if any(c["Name"] == name for c in state.containers.values()):
+                raise Conflict(f'Conflict. The container name "/{name}" is already in use')
+            container = state.add_container(name, image["Id"], body.get("Labels") or {}, tty=bool(body.get("Tty")))
+            state.publish("container", "create", container["Id"], {"name": name, "image": container["Image"]})
+        self._send_json(201, {"Id": container["Id"], "Warnings": []})
+
+    @route("GET", "/containers/{ref}/json")
+    def inspect_container(self, ref: str):
+        with self.server.state.lock:
+            document = container_inspect(self._container(ref))
+        self._send_json(200, document)
+
+    def _transition(self, ref: str, target: str, action: str, when_running: Optional[bool] = None):
+        """Moves a container to ``target``; with ``when_running`` set, only from that running state."""
+        self._read_body()
+        state = self.server.state
+        with state.lock:
+            container = self._container(ref)
+            if when_running is not None and (container["State"] == "running") != when_running:
+                self._send(304)  # Already started or stopped, as the daemon answers
+                return
+            if action == "restart":
+                container["Restarts"] += 1
+            state.set_state(container, target, action)
+        self._send(204)
+
+    @route("POST", "/containers/{ref}/start")
+    def start_container(self, ref: str):
+        self._transition(ref, "running", "start", when_running=False)
+
+    @route("POST", "/containers/{ref}/stop")
+    def stop_container(self, ref: str):
+        self._transition(ref, "exited", "die", when_running=True)
+
+    @route("POST", "/containers/{ref}/restart")
+    def restart_container(self, ref: str):
+        self._transition(ref, "running", "restart")
+
+    @route("POST", "/containers/{ref}/kill")
+    def kill_container(self, ref: str):
+        self._transition(ref, "exited", "kill", when_running=True)
+
+    @route("DELETE", "/containers/{ref}")
+    def remove_container(self, ref: str):
+        state = self.server.state
+        with state.lock:
+            container = self._container(ref)
+            if container["State"] == "running" and not self._flag("force"):
+                raise Conflict(f"You cannot remove a running container {container['Id']}. Stop the container before attempting removal or force remove")
+            del state.containers[container["Id"]]
+            state.publish("container", "destroy", container["Id"], {"name": container["Name"], "image": container["Image"]})
+        self._send(204)
+
+    @route("GET", "/containers/{ref}/logs")
+    def container_logs(self, ref: str):
+        config = self.server.config
+        with self.server.state.lock:
+            container = dict(self._container(ref))
+        streams = [s for s, flag in ((1, self._flag("stdout")), (2, self._flag("stderr"))) if flag]
+        timestamps = self._flag("timestamps")
+        tail = self.query.get("tail", "all")
+        total = config.log_lines
+        first = 0 if tail == "all" else max(total - int(tail), 0)
+        since = float(self.query.get("since") or 0)
+        until = float(self.query.get("until") or 0)
+        start = container["Created"] - total  # One history line per second, ending when the container was created
+
+        def encode(n: int, at: float) -> bytes:
+            line = log_line(container, n, at, config.log_line_bytes, timestamps)
+            stream = streams[n % len(streams)] if streams else 1
+            return line if container["Tty"] else frame(stream, line)
+
+        content_type = "application/vnd.docker.raw-stream" if container["Tty"] else "application/vnd.docker.multiplexed-stream"
+        try:
+            self._start_stream(content_type)
+            if streams:
+                batch = []
+                for n in range(first, total):
+                    at = start + n
+                    if (since and at < since) or (until and at >= until):
+                        continue
+                    batch.append(encode(n, at))
+                    if len(batch) >= 256:
+                        self._chunk(b"".join(batch))
+                        batch = []
+                self._chunk(b"".join(batch))
+                if self._flag("follow") and container["State"] == "running":
+                    n = total
+                    interval = 1 / config.log_rate if config.log_rate > 0 else 1.0
+                    while not self.server.stopping.wait(interval):
+                        if config.log_rate > 0:
+                            self._chunk(encode(n, time.time()))
+                            n += 1
+            self._end_stream()
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    @route("GET", "/containers/{ref}/stats")
+    def container_stats(self, ref: str):
+        with self.server.state.lock:
+            container = self._container(ref)
+            sample = container_stats(container, time.time())
+        self._send_json(200, sample)
+
+    # Images and builds
+
+    @route("GET", "/images/json")
+    def list_images(self):
+        with self.server.state.lock:
+            images = [dict(image, RepoTags=list(image["RepoTags"]) or ["<none>:<none>"]) for image in self.server.state.images.values()]
+        self._send_json(200, images)
+
+    @route("GET", "/images/{name}/json")
+    def inspect_image(self, name: str):
+        with self.server.state.lock:
+            image = self.server.state.find_image(name)
+            if image is None:
+                raise NotFound(f"No such image: {name}")
+            document = dict(image, RepoTags=list(image["RepoTags"]), Config={"Labels": image["Labels"]})
+        self._send_json(200, document)
+
+    @route("POST", "/images/create")
+    def pull_image(self):
+        self._read_body()
+        name = self.query.get("fromImage", "")
+        tag = self.query.get("tag") or "latest"
+        state = self.server.state
+        with state.lock:
+            state.add_image(f"{name}:{tag}")
+            state.publish("image", "pull", f"{name}:{tag}", {"name": f"{name}:{tag}"})
+        self._start_stream("application/json")
+        self._chunk(json.dumps({"status": f"Pulling from {name}", "id": tag}).encode() + b"\n")
+        self._chunk(json.dumps({"status": f"Status: Downloaded newer image for {name}:{tag}"}).encode() + b"\n")
+        self._end_stream()
+
+    @route("POST", "/build")
+    def build(self):
+        context = self._read_body()
+        config = self.server.config
+        tag = self.query.get("t") or ""
+        image_ref = tag or _digest("build", len(context), time.time())[:12]
+        try:
+            self._start_stream("application/json")
+            for step in range(1, config.build_steps + 1):
+                self._chunk(json.dumps({"stream": f"Step {step}/{config.build_steps} : RUN step {step}\n"}).encode() + b"\n")
+                time.sleep(config.latency_ms / 1000)
+            state = self.server.state
+            with state.lock:
+                image_id = state.add_image(tag if ":" in tag.split("/")[-1] else f"{tag}:latest") if tag else "sha256:" + _digest("build", image_ref)
+                state.publish("image", "tag", image_id, {"name": tag})
+            self._chunk(json.dumps({"aux": {"ID": image_id}}).encode() + b"\n")
+            self._chunk(json.dumps({"stream": f"Successfully built {image_id[7:19]}\n"}).encode() + b"\n")
+            if tag:
+                self._chunk(json.dumps({"stream": f"Successfully tagged {tag}\n"}).encode() + b"\n")
+            self._end_stream()
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    # Volumes
+
+    @route("POST", "/volumes/create")
+    def create_volume(self):
+        body = self._json_body()
+        name = body.get("Name") or _digest("volume", time.time())
+        volume = {"Name": name, "Driver": body.get("Driver") or "local", "Mountpoint": f"/var/lib/docker/volumes/{name}/_data",
+                  "Labels": body.get("Labels") or {}, "Scope": "local", "Options": body.get("DriverOpts") or {}}
+        with self.server.state.lock:
+            self.server.state.volumes.setdefault(name, volume)
+        self._send_json(201, volume)
+
+    @route("GET", "/volumes")
+    def list_volumes(self):
+        with self.server.state.lock:
+            volumes = list(self.server.state.volumes.values())
+        self._send_json(200, {"Volumes": volumes, "Warnings": []})
+
+
+class FakeEngineServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128  # Unix sockets refuse, rather than queue, connections past the backlog
+
+    def __init__(self, socket_path: str, config: FakeEngineConfig):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, EngineHandler)
+        self.socket_path = socket_path
+        self.config = config
+        self.state = EngineState(config)
+        self.stopping = threading.Event()
+        self._counts: Counter = Counter()
+        self._counts_lock = threading.Lock()
+        self._jitter = random.Random(config.seed)
+
+    def count(self, label: str):
+        with self._counts_lock:
+            self._counts[label] += 1
+
+    def request_counts(self) -> Dict[str, int]:
+        with self._counts_lock:
+            return dict(self._counts)
+
+    def delay(self):
+        seconds = (self.config.latency_ms + self._jitter.uniform(0, self.config.jitter_ms)) / 1000
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def generate_events(self):
+        """Flips random containers between running and exited at ``event_rate`` per second."""
+        interval = 1 / self.config.event_rate
+        rng = random.Random(self.config.seed + 1)
+        while not self.stopping.wait(interval):
+            with self.state.lock:
+                if not self.state.containers:
+                    continue
+                container = self.state.containers[rng.choice(sorted(self.state.containers))]
+                if container["State"] == "running":
+                    self.state.set_state(container, "exited", "die")
+                else:
+                    self.state.set_state(container, "running", "start")
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+class FakeEngine:
+    """Runs a FakeEngineServer in background threads; use as a context manager."""
+
+    def __init__(self, socket_path: str, config: Optional[FakeEngineConfig] = None):
+        self.socket_path = socket_path
+        self.config = config or FakeEngineConfig()
+        self.server: Optional[FakeEngineServer] = None
+        self._threads: List[threading.Thread] = []
+
+    @property
+    def docker_host(self) -> str:
+        return f"unix://{os.path.abspath(self.socket_path)}"
+
+    @property
+    def state(self) -> EngineState:
+        return self.server.state
+
+    def request_counts(self) -> Dict[str, int]:
+        return self.server.request_counts()
+
+    def start(self) -> "FakeEngine":
+        self.server = FakeEngineServer(self.socket_path, self.config)
+        self._threads = [threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.1}, name="fake-engine", daemon=True)]
+        if self.config.event_rate > 0:
+            self._threads.append(threading.Thread(target=self.server.generate_events, name="fake-engine-events", daemon=True))
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.stopping.set()
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def __enter__(self) -> "FakeEngine":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def add_config_arguments(parser: argparse.ArgumentParser):
+    """Adds one option per FakeEngineConfig field, e.g. --latency-ms."""
+    for name, default in asdict(FakeEngineConfig()).items():
+        parser.add_argument("--" + name.replace("_", "-"), dest=name, type=type(default), default=default)
+
+
+def config_from_args(args: argparse.Namespace) -> FakeEngineConfig:
+    return FakeEngineConfig(**{name: getattr(args, name) for name in asdict(FakeEngineConfig())})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("socket", help="Unix socket path to listen on")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    engine = FakeEngine(args.socket, config_from_args(args)).start()
+    print(f"Fake Docker Engine listening; export DOCKER_HOST={engine.docker_host}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.stop()
+
+
+if __name__ == "__main__":
+    main()
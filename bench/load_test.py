@@ -0,0 +1,454 @@
+"""Load test of every HTTP API route against a fake Docker Engine.
+
+Starts a fake engine (bench/fake_engine.py) and the app under uvicorn, both
+on Unix sockets in a temporary directory, then drives each route in turn at
+a fixed concurrency over keep-alive connections. For every scenario it
+reports throughput, p50/p95/p99 latency and the daemon requests the fake
+engine served per API call.
+
+Results can be saved as a JSON baseline, and a later run compared against
+it: the run fails (exit status 1) when a scenario makes more daemon
+requests per call, returns more unexpected statuses, or gets slower than
+the baseline by more than the tolerance. Daemon request counts do not
+depend on the machine, so ``--counts-only`` compares just those against a
+baseline recorded elsewhere.
+
+    python -m bench.load_test --save bench/baseline.json
+    python -m bench.load_test --compare bench/baseline.json [--counts-only]
+
+Background work that would blur the per-scenario counts (stats sampling,
+periodic index resyncs) is slowed right down for the run; each scenario
+starts once the fake engine has been idle for a moment, and its counts
+include the index refreshes its own changes trigger.
+"""
+import argparse
+import asyncio
+import base64
+import importlib.util
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+from bench.fake_engine import FakeEngine, add_config_arguments, config_from_args
+
+# (method, path, headers, body) for request number i of a scenario
+Request = Tuple[str, str, Dict[str, str], bytes]
+
+
+@dataclass
+class Scenario:
+    name: str
+    route: str  # The route template, for the report
+    make: Callable[[int], Request]
+    share: float = 1.0  # Fraction of --requests this scenario sends; bcrypt and builds are slow
+    expect: Tuple[int, ...] = (200,)
+    websocket_messages: int = 0  # For WebSocket routes: messages to read before closing
+    max_requests: Optional[int] = None  # For scenarios that use up containers
+
+
+@dataclass
+class Result:
+    requests: int
+    concurrency: int
+    errors: int
+    throughput: float
+    p50: float
+    p95: float
+    p99: float
+    daemon_requests_per_call: float
+    daemon_requests: Dict[str, int]
+    statuses: Dict[str, int] = field(default_factory=dict)
+
+
+class Response:
+    def __init__(self, status: int, headers: Dict[str, str], body: bytes):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class Connection:
+    """One keep-alive HTTP/1.1 connection to the app's Unix socket."""
+
+    def __init__(self, socket_path: str):
+        self.socket_path = socket_path
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    async def request(self, method: str, path: str, headers: Optional[Dict[str, str]] = None, body: bytes = b"") -> Response:
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_unix_connection(self.socket_path, limit=2 ** 20)
+        lines = [f"{method} {path} HTTP/1.1", "Host: bench", f"Content-Length: {len(body)}"]
+        lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        self._writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+        try:
+            response = await self._read_response(method)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            self.close()
+            raise
+        if response.headers.get("connection", "").lower() == "close":
+            self.close()
+        return response
+
+    async def _read_response(self, method: str) -> Response:
+        head = await self._reader.readuntil(b"\r\n\r\n")
+        status_line, *header_lines = head.decode("latin-1").split("\r\n")
+        status = int(status_line.split()[1])
+        headers = {}
+        for line in header_lines:
+            if line:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+        if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+            return Response(status, headers, b"")
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await self._reader.readline()).split(b";")[0].strip(), 16)
+                if size == 0:
+                    await self._reader.readline()
+                    break
+                chunks.append(await self._reader.readexactly(size))
+                await self._reader.readline()
+            return Response(status, headers, b"".join(chunks))
+        return Response(status, headers, await self._reader.readexactly(int(headers.get("content-length", 0))))
+
+    async def websocket(self, path: str, messages: int) -> int:
+        """Opens a WebSocket, reads ``messages`` text frames and closes it. Returns 101, or the refusal status."""
+        self.close()
+        reader, writer = await asyncio.open_unix_connection(self.socket_path, limit=2 ** 20)
+        try:
+            key = base64.b64encode(os.urandom(16)).decode()
+            writer.write((
+                f"GET {path} HTTP/1.1\r\nHost: bench\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n"
+            ).encode())
+            head = await reader.readuntil(b"\r\n\r\n")
+            status = int(head.split(b" ", 2)[1])
+            if status != 101:
+                return status
+            received = 0
+            while received < messages:
+                first, second = await reader.readexactly(2)
+                length = second & 0x7F
+                if length == 126:
+                    length = int.from_bytes(await reader.readexactly(2), "big")
+                elif length == 127:
+                    length = int.from_bytes(await reader.readexactly(8), "big")
+                await reader.readexactly(length)
+                opcode = first & 0x0F
+                if opcode == 0x8:  # Closed by the server
+                    return 1000 + received if received < messages else 101
+                if opcode == 0x1:
+                    received += 1
+            mask = os.urandom(4)
+            payload = (1000).to_bytes(2, "big")
+            writer.write(bytes((0x88, 0x80 | len(payload))) + mask + bytes(b ^ mask[i % 4] for i, b in enumerate(payload)))
+            await writer.drain()
+            return 101
+        finally:
+            writer.close()
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._reader = self._writer = None
+
+
+async def fetch(socket_path: str, method: str, path: str, headers: Optional[Dict[str, str]] = None, body: bytes = b"") -> Response:
+    """One request on a fresh connection, for setup steps between scenarios."""
+    connection = Connection(socket_path)
+    try:
+        return await connection.request(method, path, headers, body)
+    finally:
+        connection.close()
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(math.ceil(p / 100 * len(sorted_values)) - 1, 0)]
+
+
+def form(**fields) -> Tuple[Dict[str, str], bytes]:
+    return {"Content-Type": "application/x-www-form-urlencoded"}, urlencode(fields).encode()
+
+
+def build_scenarios(engine: FakeEngine, token: str, context_dir: str) -> Tuple[List[Scenario], List[str], Dict[str, str]]:
+    """Every route in docker_routes.py and auth_routes.py, in an order where each scenario leaves state the next can use.
+
+    Also returns the build job IDs and ETag the scenarios read, for the caller to fill in.
+    """
+    auth = {"Authorization": f"Bearer {token}"}
+    state = engine.state
+    with state.lock:
+        running = sorted(cid for cid, c in state.containers.items() if c["State"] == "running")
+    half = len(running) // 2
+    to_stop, to_read = running[:half], running[half:]  # Stopping and removing must not touch the containers read from
+    build_jobs: List[str] = []
+    etag: Dict[str, str] = {}
+
+    def pick(ids: List[str], i: int) -> str:
+        return ids[i % len(ids)]
+
+    def posted(path: str, **fields) -> Request:
+        headers, body = form(**fields)
+        return "POST", path, {**auth, **headers}, body
+
+    def build_job(i: int) -> str:
+        return build_jobs[i % len(build_jobs)] if build_jobs else "missing"
+
+    def bulk(i: int) -> Request:
+        body = json.dumps({"action": "restart", "label": f"group={i % 10}", "stop_timeout": 0}).encode()
+        return "POST", "/docker/containers/bulk", {**auth, "Content-Type": "application/json"}, body
+
+    return [
+        Scenario("auth_signup", "POST /auth/signup/", lambda i: ("POST", "/auth/signup/?" + urlencode({"username": f"bench-user-{i}", "password": "bench"}), {}, b""), share=0.1),
+        Scenario("auth_login", "POST /auth/login/", lambda i: ("POST", "/auth/login/", *form(username="admin", password="password123")), share=0.1),
+        Scenario("containers_status", "GET /docker/containers_status/", lambda i: ("GET", "/docker/containers_status/", auth, b"")),
+        Scenario("containers_status_filtered", "GET /docker/containers_status/", lambda i: ("GET", "/docker/containers_status/?status=running&label=group%3D1&limit=50", auth, b"")),
+        Scenario("containers_status_not_modified", "GET /docker/containers_status/", lambda i: ("GET", "/docker/containers_status/", {**auth, "If-None-Match": etag.get("value", "*")}, b""), expect=(304,)),
+        Scenario("containers_status_legacy", "GET /containers_status/", lambda i: ("GET", "/containers_status/", auth, b"")),
+        Scenario("container_logs", "GET /docker/container_logs/{container_id}", lambda i: ("GET", f"/docker/container_logs/{pick(to_read, i)}", auth, b"")),
+        Scenario("container_logs_stream", "GET /docker/container_logs/{container_id}/stream", lambda i: ("GET", f"/docker/container_logs/{pick(to_read, i)}/stream?format=ndjson&tail=100", auth, b"")),
+        Scenario("container_logs_ws", "WS /docker/container_logs/{container_id}/ws", lambda i: ("GET", f"/docker/container_logs/{pick(to_read, i)}/ws?" + urlencode({"token": token, "tail": 20}), {}, b""),
+                 share=0.25, expect=(101,), websocket_messages=20),
+        Scenario("stats_top", "GET /docker/stats/top", lambda i: ("GET", "/docker/stats/top?metric=cpu_percent&n=10", auth, b"")),
+        Scenario("container_stats", "GET /docker/stats/{container_id}", lambda i: ("GET", f"/docker/stats/{pick(to_read, i)}", auth, b"")),
+        Scenario("build_image", "POST /docker/build_image/", lambda i: posted("/docker/build_image/", image_name=f"bench/build:{i}", dockerfile_path=context_dir), share=0.1, expect=(202,)),
+        Scenario("list_builds", "GET /docker/builds/", lambda i: ("GET", "/docker/builds/", auth, b"")),
+        Scenario("build_status", "GET /docker/builds/{job_id}", lambda i: ("GET", f"/docker/builds/{build_job(i)}", auth, b"")),
+        Scenario("build_progress", "GET /docker/builds/{job_id}/progress", lambda i: ("GET", f"/docker/builds/{build_job(i)}/progress", auth, b""), share=0.25),
+        Scenario("cancel_build", "POST /docker/builds/{job_id}/cancel", lambda i: ("POST", f"/docker/builds/{build_job(i)}/cancel", auth, b""), share=0.1, expect=(200, 409)),
+        Scenario("run_container", "POST /docker/run_container/", lambda i: posted("/docker/run_container/", image_name=f"bench/app{i % 10}"), share=0.5),
+        Scenario("create_volume", "POST /docker/create_volume/", lambda i: posted("/docker/create_volume/", volume_name=f"bench-volume-{i}")),
+        Scenario("bulk_restart", "POST /docker/containers/bulk", bulk, share=0.1),
+        Scenario("stop_container", "POST /docker/stop_container/{container_id}", lambda i: ("POST", f"/docker/stop_container/{pick(to_stop, i)}", auth, b""), share=0.5, max_requests=len(to_stop)),
+        Scenario("remove_container", "POST /docker/remove_container/{container_id}", lambda i: ("POST", f"/docker/remove_container/{pick(to_stop, i)}", auth, b""), share=0.5, max_requests=len(to_stop)),
+    ], build_jobs, etag
+
+
+async def wait_for_app(socket_path: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The app exited during startup with status {process.returncode}")
+        try:
+            if (await fetch(socket_path, "GET", "/")).status == 200:
+                return
+        except (OSError, asyncio.IncompleteReadError):
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("The app did not start in time")
+
+
+async def settle(engine: FakeEngine, quiet: float = 0.5, timeout: float = 30):
+    """Waits until the fake engine has served no new requests for ``quiet`` seconds."""
+    last, last_change = engine.request_counts(), time.monotonic()
+    deadline = last_change + timeout
+    while time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+        counts = engine.request_counts()
+        if counts != last:
+            last, last_change = counts, time.monotonic()
+        elif time.monotonic() - last_change >= quiet:
+            return
+
+
+async def run_scenario(scenario: Scenario, engine: FakeEngine, socket_path: str, requests: int, concurrency: int) -> Result:
+    await settle(engine)
+    before = Counter(engine.request_counts())
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    next_index = iter(range(requests))
+
+    async def worker():
+        connection = Connection(socket_path)
+        try:
+            for i in next_index:
+                method, path, headers, body = scenario.make(i)
+                started = time.perf_counter()
+                try:
+                    if scenario.websocket_messages:
+                        status = await connection.websocket(path, scenario.websocket_messages)
+                    else:
+                        status = (await connection.request(method, path, headers, body)).status
+                except (OSError, asyncio.IncompleteReadError) as e:
+                    status = type(e).__name__
+                latencies.append(time.perf_counter() - started)
+                statuses[str(status)] += 1
+        finally:
+            connection.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    await settle(engine)
+    daemon = Counter(engine.request_counts())
+    daemon.subtract(before)
+    daemon_requests = {endpoint: n for endpoint, n in sorted(daemon.items()) if n}
+
+    latencies.sort()
+    expected = {str(status) for status in scenario.expect}
+    return Result(
+        requests=requests,
+        concurrency=concurrency,
+        errors=sum(n for status, n in statuses.items() if status not in expected),
+        throughput=round(requests / elapsed, 2),
+        p50=round(percentile(latencies, 50) * 1000, 3),
+        p95=round(percentile(latencies, 95) * 1000, 3),
+        p99=round(percentile(latencies, 99) * 1000, 3),
+        daemon_requests_per_call=round(sum(daemon_requests.values()) / requests, 3),
+        daemon_requests=daemon_requests,
+        statuses=dict(sorted(statuses.items())),
+    )
+
+
+def websockets_supported() -> bool:
+    return any(importlib.util.find_spec(name) is not None for name in ("websockets", "wsproto"))
+
+
+def app_environment(engine: FakeEngine) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update(
+        DOCKER_HOST=engine.docker_host,
+        STATS_INTERVAL="3600",  # One sampling round at startup, none during the scenarios
+        CONTAINER_INDEX_RESYNC_INTERVAL="3600",
+        PYTHONPATH=os.pathsep.join(filter(None, [os.getcwd(), env.get("PYTHONPATH")])),
+    )
+    return env
+
+
+async def run(args: argparse.Namespace) -> dict:
+    only = set(args.only.split(",")) if args.only else None
+    with tempfile.TemporaryDirectory(prefix="docker-api-bench-") as tmp:
+        context_dir = os.path.join(tmp, "context")
+        os.mkdir(context_dir)
+        with open(os.path.join(context_dir, "Dockerfile"), "w") as f:
+            f.write("FROM scratch\nCOPY . /\n")
+        app_socket = os.path.join(tmp, "app.sock")
+
+        with FakeEngine(os.path.join(tmp, "docker.sock"), config_from_args(args)) as engine:
+            process = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "app.main:app", "--uds", app_socket, "--log-level", "warning", "--no-access-log"],
+                env=app_environment(engine),
+            )
+            try:
+                await wait_for_app(app_socket, process)
+                headers, body = form(username="admin", password="password123")
+                token = (await fetch(app_socket, "POST", "/auth/login/", headers, body)).json()["access_token"]
+                auth = {"Authorization": f"Bearer {token}"}
+                await fetch(app_socket, "GET", "/docker/containers_status/", auth)  # Waits for the index to be ready
+                scenarios, build_jobs, etag = build_scenarios(engine, token, context_dir)
+
+                results = {}
+                for scenario in scenarios:
+                    if only and scenario.name not in only:
+                        continue
+                    if scenario.websocket_messages and not websockets_supported():
+                        print(f"{scenario.name:32} skipped: uvicorn has no WebSocket library (websockets or wsproto) installed", flush=True)
+                        continue
+                    if scenario.name == "containers_status_not_modified":
+                        etag["value"] = (await fetch(app_socket, "GET", "/docker/containers_status/", auth)).headers.get("etag", "*")
+                    if scenario.name == "list_builds":
+                        listing = (await fetch(app_socket, "GET", "/docker/builds/", auth)).json()
+                        build_jobs[:] = [job["job_id"] for job in listing["builds"]]
+                    requests = max(1, int(args.requests * scenario.share))
+                    if scenario.max_requests is not None:
+                        requests = min(requests, scenario.max_requests)
+                    result = run_scenario(scenario, engine, app_socket, requests, min(args.concurrency, requests))
+                    results[scenario.name] = {"route": scenario.route, **vars(await result)}
+                    print(format_row(scenario.name, results[scenario.name]), flush=True)
+            finally:
+                process.terminate()
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+    return {
+        "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "settings": {"requests": args.requests, "concurrency": args.concurrency, "engine": vars(config_from_args(args))},
+        "scenarios": results,
+    }
+
+
+HEADER = f"{'scenario':32} {'reqs':>5} {'errs':>4} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'daemon/call':>11}"
+
+
+def format_row(name: str, result: dict) -> str:
+    return (f"{name:32} {result['requests']:>5} {result['errors']:>4} {result['throughput']:>9.1f} "
+            f"{result['p50']:>8.2f} {result['p95']:>8.2f} {result['p99']:>8.2f} {result['daemon_requests_per_call']:>11.2f}")
+
+
+def compare(current: dict, baseline: dict, tolerance: float, count_tolerance: float, counts_only: bool) -> List[str]:
+    """Returns one message per regression of ``current`` against ``baseline``."""
+    regressions = []
+    for name, base in baseline["scenarios"].items():
+        result = current["scenarios"].get(name)
+        if result is None:
+            continue
+        allowed = base["daemon_requests_per_call"] * (1 + count_tolerance) + 0.01
+        if result["daemon_requests_per_call"] > allowed:
+            regressions.append(f"{name}: {result['daemon_requests_per_call']} daemon requests per call, baseline {base['daemon_requests_per_call']}")
+        if result["errors"] > base["errors"]:
+            regressions.append(f"{name}: {result['errors']} unexpected responses {result['statuses']}, baseline {base['errors']}")
+        if counts_only:
+            continue
+        if result["p95"] > base["p95"] * (1 + tolerance) and result["p95"] - base["p95"] > 1.0:  # Ignore sub-millisecond noise
+            regressions.append(f"{name}: p95 {result['p95']} ms, baseline {base['p95']} ms")
+        if result["throughput"] < base["throughput"] * (1 - tolerance):
+            regressions.append(f"{name}: {result['throughput']} req/s, baseline {base['throughput']} req/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario, scaled down for the slow ones")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--only", help="Comma-separated scenario names")
+    parser.add_argument("--save", metavar="PATH", help="Write the results as a JSON baseline")
+    parser.add_argument("--compare", metavar="PATH", help="Fail if the results regress against this baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative p95/throughput regression")
+    parser.add_argument("--count-tolerance", type=float, default=0.1, help="Allowed relative increase in daemon requests per call")
+    parser.add_argument("--counts-only", action="store_true", help="Compare only daemon request counts and errors")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    print(HEADER, flush=True)
+    results = asyncio.run(run(args))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        print(f"Saved baseline to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline["settings"] != results["settings"]:
+            print(f"Note: {args.compare} was recorded with different settings: {json.dumps(baseline['settings'])}")
+        regressions = compare(results, baseline, args.tolerance, args.count_tolerance, args.counts_only)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import pytest
+
+from app import auth
+from app.auth import TokenCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(auth.time, "time", lambda: now[0])
+    return now
+
+
+def test_cached_token_expires_at_its_exp_before_the_ttl(clock):
+    cache = TokenCache(ttl=300)
+    cache.put("token", "alice", expires_at=clock[0] + 10)
+    clock[0] += 9.9
+    assert cache.get("token") == "alice"
+    clock[0] += 0.1
+    assert cache.get("token") is None
+
+
+def test_cached_token_expires_at_the_ttl_before_its_exp(clock):
+    cache = TokenCache(ttl=30)
+    cache.put("token", "alice", expires_at=clock[0] + 3600)
+    clock[0] += 29
+    assert cache.get("token") == "alice"
+    clock[0] += 1
+    assert cache.get("token") is None
+
+
+def test_token_already_past_its_exp_is_never_served(clock):
+    cache = TokenCache(ttl=300)
+    cache.put("token", "alice", expires_at=clock[0] - 1)
+    assert cache.get("token") is None
+
+
+def test_least_recently_used_token_is_evicted(clock):
+    cache = TokenCache(max_size=2, ttl=300)
+    cache.put("a", "alice", expires_at=None)
+    cache.put("b", "bob", expires_at=None)
+    assert cache.get("a") == "alice"
+    cache.put("c", "carol", expires_at=None)
+    assert cache.get("b") is None
+    assert cache.get("a") == "alice"
+    assert cache.get("c") == "carol"
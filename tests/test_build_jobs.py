@@ -0,0 +1,93 @@
+import asyncio
+import functools
+import threading
+
+import docker
+import pytest
+
+from app.build_jobs import BuildJob, BuildQueue, ContextChanged, ContextSnapshot, stream_context, HASHING, SUCCEEDED
+from app.docker_client import AsyncDocker
+from bench.fake_engine import FakeEngine, FakeEngineConfig
+
+
+def make_job(max_events: int) -> BuildJob:
+    return BuildJob("app:latest", "/context", "Dockerfile", "hash", max_events=max_events)
+
+
+def test_follow_replays_retained_events_then_waits_for_new_ones():
+    async def run():
+        job = make_job(10)
+        job.publish({"n": 0})
+        received = []
+
+        async def consume():
+            async for event in job.follow():
+                received.append(event)
+
+        consumer = asyncio.create_task(consume())
+        await asyncio.sleep(0)
+        job.publish({"n": 1})
+        await asyncio.sleep(0)
+        job.finish(SUCCEEDED, image_id="sha256:1")
+        await asyncio.wait_for(consumer, 1)
+        return received
+
+    assert asyncio.run(run()) == [{"n": 0}, {"n": 1}, {"status": SUCCEEDED, "image_id": "sha256:1", "error": None}]
+
+
+def test_follow_skips_events_evicted_while_paused():
+    async def run():
+        job = make_job(3)
+        for n in range(3):
+            job.publish({"n": n})
+        follower = job.follow()
+        received = [await follower.__anext__()]
+        job.publish({"n": 3})  # Evicts n=0, already sent
+        job.publish({"n": 4})  # Evicts n=1, never sent
+        job.finish(SUCCEEDED)
+        received += [event async for event in follower]
+        return received
+
+    events = asyncio.run(run())
+    assert [event.get("n", event.get("status")) for event in events] == [0, 3, 4, SUCCEEDED]
+
+
+@pytest.fixture
+def context(tmp_path):
+    context = tmp_path / "context"
+    context.mkdir()
+    (context / "Dockerfile").write_text("FROM scratch\nCOPY app.py /\n")
+    (context / "app.py").write_text("print('hello')\n")
+    return context
+
+
+def test_identical_submissions_build_once(context, tmp_path):
+    config = FakeEngineConfig(containers=0, latency_ms=20, jitter_ms=0, build_steps=5)
+
+    async def run(engine):
+        docker_layer = AsyncDocker(client_factory=functools.partial(docker.DockerClient, base_url=engine.docker_host))
+        builds = BuildQueue(docker_layer)
+        builds.start()
+        try:
+            first = await builds.submit(str(context), "app:1")
+            second = await builds.submit(str(context), "app:1")
+            assert first.status == second.status == HASHING  # Returned before the context was read
+            await asyncio.wait_for(asyncio.gather(first.wait(), second.wait()), 10)
+            return first, second
+        finally:
+            await builds.stop()
+            docker_layer.close()
+
+    with FakeEngine(str(tmp_path / "docker.sock"), config) as engine:
+        first, second = asyncio.run(run(engine))
+        assert engine.request_counts()["POST /build"] == 1
+    assert first.status == second.status == SUCCEEDED
+    assert second.image_id == first.image_id and first.image_id is not None
+    assert second.coalesced_into == first.id and first.submissions == 2
+
+
+def test_build_fails_if_the_context_changed_since_it_was_hashed(context):
+    snapshot = ContextSnapshot(str(context), "Dockerfile")
+    (context / "app.py").write_text("print('changed after hashing')\n")
+    with pytest.raises(ContextChanged):
+        b"".join(stream_context(snapshot, 1024, threading.Event()))
@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+from app.container_index import ContainerIndex
+
+
+def record(container_id: str, status: str = "running", labels: dict = None) -> dict:
+    return {
+        "container_id": container_id,
+        "container_name": f"name-{container_id}",
+        "image_name": ["app:latest"],
+        "image_id": "sha256:app",
+        "status": status,
+        "labels": labels or {},
+    }
+
+
+def make_index(changelog_size: int = 100) -> ContainerIndex:
+    index = ContainerIndex(docker_layer=None, changelog_size=changelog_size)
+    for container_id in ("a", "b", "c"):
+        index._apply(container_id, record(container_id))
+    return index
+
+
+def test_changes_since_reports_changes_and_removals():
+    index = make_index()
+    token = index.version_token
+    index._apply("b", record("b", status="exited"))
+    index._apply("c", None)
+    index._apply("d", record("d"))
+    changed, removed = index.changes_since(token)
+    assert [r["container_id"] for r in changed] == ["b", "d"]
+    assert removed == ["c"]
+    assert index.changes_since(index.version_token) == ([], [])
+
+
+def test_changes_since_reports_containers_leaving_the_filter_as_removed():
+    index = make_index()
+    token = index.version_token
+    index._apply("a", record("a", status="exited"))
+    assert index.changes_since(token, status="running") == ([], ["a"])
+
+
+def test_changes_since_falls_back_for_unusable_tokens():
+    index = make_index(changelog_size=2)
+    old = index.version_token
+    for status in ("exited", "running", "exited"):
+        index._apply("a", record("a", status=status))
+    assert index.changes_since(old) is None  # Older than the changelog reaches
+    assert index.changes_since(f"{index.epoch}-{index.version + 1}") is None  # From the future
+    assert index.changes_since("garbage") is None
+
+
+def test_tokens_from_before_a_restart_do_not_match():
+    before = make_index()
+    token = before.version_token
+    after = make_index()  # Same history, new process
+    after._apply("c", None)
+    assert after.changes_since(token) is None
+    assert after.etag != before.etag
+
+
+def test_wait_ready_does_not_swallow_a_cancellation_that_lands_as_the_index_becomes_ready():
+    async def scenario():
+        index = make_index()
+        waiter = asyncio.create_task(index.wait_ready(timeout=5))
+        await asyncio.sleep(0)  # The waiter is now blocked on the ready event
+        index._ready.set()
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+    asyncio.run(scenario())
@@ -0,0 +1,62 @@
+"""Container listings must cost the same number of daemon requests however many containers there are."""
+import asyncio
+import functools
+from collections import Counter
+
+import docker
+import pytest
+
+from app.container_index import ContainerIndex
+from app.docker_client import AsyncDocker, init_docker, close_docker, list_containers
+from app.docker_manager import get_running_containers
+from bench.fake_engine import FakeEngine, FakeEngineConfig
+
+
+@pytest.fixture(params=[1, 500])
+def engine(request, tmp_path):
+    with FakeEngine(str(tmp_path / "docker.sock"), FakeEngineConfig(containers=request.param, latency_ms=0, jitter_ms=0)) as engine:
+        yield engine
+
+
+def daemon_requests(engine: FakeEngine, listing) -> Counter:
+    """Runs ``listing(docker_layer)`` on a fresh event loop and returns the daemon requests it made."""
+    async def measure():
+        docker_layer = AsyncDocker(client_factory=functools.partial(docker.DockerClient, base_url=engine.docker_host))
+        try:
+            await docker_layer.run(lambda client: client.ping())  # Creates the client, which asks for the API version
+            before = Counter(engine.request_counts())
+            await listing(docker_layer)
+            return Counter(engine.request_counts()) - before
+        finally:
+            docker_layer.close()
+
+    return asyncio.run(measure())
+
+
+def test_list_containers(engine):
+    async def listing(docker_layer):
+        records = await docker_layer.run(list_containers, all=True)
+        assert len(records) == len(engine.state.containers)
+
+    assert daemon_requests(engine, listing) == {"GET /containers/json": 1, "GET /images/json": 1}
+
+
+def test_get_running_containers(engine):
+    async def listing(docker_layer):
+        init_docker(docker_layer)
+        try:
+            containers = await get_running_containers()
+        finally:
+            close_docker()
+        assert len(containers) == sum(c["State"] == "running" for c in engine.state.containers.values())
+
+    assert daemon_requests(engine, listing) == {"GET /containers/json": 1, "GET /images/json": 1}
+
+
+def test_container_index_resync(engine):
+    async def listing(docker_layer):
+        index = ContainerIndex(docker_layer)
+        await index._resync()
+        assert len(index.query()[0]) == len(engine.state.containers)
+
+    assert daemon_requests(engine, listing) == {"GET /containers/json": 1, "GET /images/json": 1}
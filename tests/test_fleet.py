@@ -0,0 +1,62 @@
+from collections import Counter
+
+import pytest
+
+from app.fleet import Fleet, HashRing, consistent_hash, image_locality, least_loaded
+
+NAMES = [f"web-{i}" for i in range(1000)]
+
+
+@pytest.fixture
+def fleet():
+    fleet = Fleet([(name, f"tcp://10.0.0.{i}:2375") for i, name in enumerate("abc", start=1)])
+    yield fleet
+    fleet.close()
+
+
+def test_hash_ring_spreads_keys_over_every_host():
+    ring = HashRing(("a", "b", "c"))
+    owners = Counter(ring.lookup(name) for name in NAMES)
+    assert set(owners) == {"a", "b", "c"}
+    assert min(owners.values()) > len(NAMES) / 3 * 0.6
+
+
+def test_removing_a_host_only_moves_the_keys_it_owned():
+    before = HashRing(("a", "b", "c"))
+    after = HashRing(("a", "b"))
+    for name in NAMES:
+        if before.lookup(name) != "c":
+            assert after.lookup(name) == before.lookup(name)
+
+
+def test_least_loaded_counts_placements_and_breaks_ties_by_name(fleet):
+    a, b, c = fleet.hosts.values()
+    a.running, b.running, c.running = 2, 1, 1
+    assert least_loaded([a, b, c], "nginx:latest", None) is b
+    b.placed = 1
+    assert least_loaded([a, b, c], "nginx:latest", None) is c
+
+
+def test_consistent_hash_is_stable_and_falls_back_for_unnamed_containers(fleet):
+    hosts = list(fleet.hosts.values())
+    owner = consistent_hash(hosts, "nginx:latest", "web-1")
+    assert consistent_hash(list(reversed(hosts)), "nginx:latest", "web-1") is owner
+    hosts[0].running = 5
+    assert consistent_hash(hosts, "nginx:latest", None) is hosts[1]
+
+
+def test_image_locality_prefers_hosts_with_the_image(fleet):
+    a, b, c = fleet.hosts.values()
+    c.running = 10
+    c.images = {"nginx:latest"}
+    assert image_locality([a, b, c], "nginx:latest", None) is c
+    assert image_locality([a, b, c], "redis:latest", None) is a
+
+
+def test_place_skips_unhealthy_hosts_and_counts_the_placement(fleet):
+    a, b, c = fleet.hosts.values()
+    a.healthy = False
+    host = fleet.place("nginx:latest", strategy="least_loaded")
+    assert host is b
+    assert b.placed == 1
+    assert fleet.place("nginx:latest", strategy="least_loaded") is c
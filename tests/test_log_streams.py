@@ -0,0 +1,81 @@
+import asyncio
+import functools
+
+import docker
+import pytest
+
+from app.docker_client import AsyncDocker
+from app.log_streams import FrameDemuxer, LineSplitter, LogHub, LogStreamLagged
+from bench.fake_engine import FakeEngine, FakeEngineConfig, frame
+
+
+def test_frame_demuxer_handles_headers_split_across_chunks():
+    data = frame(1, b"hello\n") + frame(2, b"oops\n") + frame(1, b"") + frame(1, b"bye\n")
+    for size in (1, 3, 7, 8, 9, len(data)):
+        demuxer = FrameDemuxer()
+        pieces = []
+        for i in range(0, len(data), size):
+            pieces += demuxer.feed(data[i:i + size])
+        merged = {}
+        for stream, piece in pieces:
+            merged[stream] = merged.get(stream, b"") + piece
+        assert merged == {"stdout": b"hello\nbye\n", "stderr": b"oops\n"}, size
+
+
+def test_frame_demuxer_streams_large_frames_piecewise():
+    demuxer = FrameDemuxer()
+    assert demuxer.feed(frame(2, b"x" * 100)[:58]) == [("stderr", b"x" * 50)]
+    assert demuxer.feed(b"x" * 50) == [("stderr", b"x" * 50)]
+
+
+def test_line_splitter():
+    splitter = LineSplitter(max_line_length=5)
+    assert splitter.feed(b"ab\ncd") == ["ab"]
+    assert splitter.feed("é".encode()[:1]) == []  # Half a UTF-8 character waits for the rest
+    assert splitter.feed("é".encode()[1:] + b"\n") == ["cdé"]
+    assert splitter.feed(b"0123456789abc") == ["01234", "56789"]
+    assert splitter.flush() == ["abc"]
+    assert splitter.flush() == []
+
+
+@pytest.fixture
+def engine(tmp_path):
+    config = FakeEngineConfig(containers=4, latency_ms=0, jitter_ms=0, log_lines=300, log_rate=200)
+    with FakeEngine(str(tmp_path / "docker.sock"), config) as engine:
+        yield engine
+
+
+def follow(engine: FakeEngine, tail, pieces: int, delay: float, **hub_options) -> int:
+    """Follows a running container's logs, reading ``pieces`` pieces ``delay`` seconds apart."""
+    container_id = next(cid for cid, c in engine.state.containers.items() if c["State"] == "running" and not c["Tty"])
+
+    async def read():
+        docker_layer = AsyncDocker(client_factory=functools.partial(docker.DockerClient, base_url=engine.docker_host))
+        try:
+            subscription = await LogHub(docker_layer, **hub_options).open(container_id, follow=True, tail=tail)
+            received = 0
+            async for _ in subscription:
+                received += 1
+                await asyncio.sleep(delay)
+                if received == pieces:
+                    break
+            subscription.close()
+            return received
+        finally:
+            docker_layer.close()
+
+    return asyncio.run(read())
+
+
+def test_follower_is_not_dropped_while_its_history_is_sent(engine):
+    """Live output piling up behind a long history must not count as lagging."""
+    # 2ms per piece is slower than the history arrives, but faster than the live output
+    try:
+        assert follow(engine, None, 300 + 100, 0.002, buffer_size=8) == 400
+    except LogStreamLagged:
+        pytest.fail("Follower was dropped although it kept up with the live output")
+
+
+def test_follower_that_falls_behind_is_dropped(engine):
+    with pytest.raises(LogStreamLagged):
+        follow(engine, 0, 1000, 0.02, buffer_size=4, catchup_size=4)
@@ -0,0 +1,16 @@
+import logging
+
+from app.metrics import Gauge
+
+
+def test_gauge_callback_value_is_read_at_collection():
+    gauge = Gauge("queue_depth", "Items queued.", callback=lambda: 3)
+    assert gauge.collect()[-1] == "queue_depth 3"
+
+
+def test_failing_gauge_callback_is_logged_and_skipped(caplog):
+    gauge = Gauge("hosts_healthy", "Healthy hosts.", callback=lambda: len(None))
+    with caplog.at_level(logging.ERROR, logger="app.metrics"):
+        lines = gauge.collect()
+    assert lines == ["# HELP hosts_healthy Healthy hosts.", "# TYPE hosts_healthy gauge"]
+    assert "hosts_healthy" in caplog.text
@@ -0,0 +1,35 @@
+import pytest
+
+from app.stats_collector import METRICS, RingBuffer, SeriesTier
+
+
+@pytest.mark.parametrize("appended", [0, 1, 3, 4, 5, 7, 8, 9, 23])
+def test_ring_buffer_keeps_the_newest_values_oldest_first(appended):
+    buffer = RingBuffer(4)
+    for value in range(appended):
+        buffer.append(value)
+    assert len(buffer) == min(appended, 4)
+    assert buffer.values() == list(range(max(appended - 4, 0), appended))
+
+
+def values(n: float):
+    return [n] * len(METRICS)
+
+
+def test_series_tier_averages_samples_per_bucket():
+    tier = SeriesTier(step=10, points=4)
+    for timestamp, value in [(100, 1), (104, 3), (112, 5), (125, 0)]:
+        tier.add(timestamp, values(value))
+    # The bucket at 120 is still open, so it is not reported yet
+    assert [(p["timestamp"], p[METRICS[0]]) for p in tier.points()] == [(100, 2), (110, 5)]
+
+
+def test_series_tier_wraps_around_to_the_newest_buckets():
+    tier = SeriesTier(step=10, points=4)
+    for bucket in range(10):
+        tier.add(bucket * 10, values(bucket))
+    tier.add(1000, values(0))  # Closes the last bucket
+    points = tier.points()
+    assert [p["timestamp"] for p in points] == [60, 70, 80, 90]
+    assert all(p[metric] == p["timestamp"] / 10 for p in points for metric in METRICS)
+    assert [p["timestamp"] for p in tier.points(since=75)] == [80, 90]